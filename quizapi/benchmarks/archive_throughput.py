@@ -0,0 +1,121 @@
+"""Throughput of submission archival and archive reads.
+
+Builds a synthetic data set spread over several old months, archives it
+and then measures:
+
+* archive write rate (submissions/s) and compression (raw row bytes vs
+  bytes on disk);
+* full-scan read rate (submissions/s and answers/s) with the peak Python
+  memory of the scan, which should track the block size, not the data size;
+* per-user history lookups through the per-segment index.
+
+    python benchmarks/archive_throughput.py --submissions 50000 --answers 10
+"""
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from common import percentile, setup_django, test_database
+
+
+def build_dataset(submissions, answers, users, months):
+    from django.utils import timezone
+    from core.models import Category, CustomUser, Question, Quiz, QuizSubmission, UserAnswer
+
+    admin = CustomUser.objects.create_user('bench-admin', password='x', role='admin')
+    people = CustomUser.objects.bulk_create(CustomUser(username=f'bench-{i}') for i in range(users))
+    category = Category.objects.create(name='Bench')
+    quizzes = Quiz.objects.bulk_create(
+        Quiz(title=f'Quiz {i}', category=category, created_by=admin) for i in range(20)
+    )
+    questions = {
+        quiz.pk: Question.objects.bulk_create(Question(quiz=quiz, text=f'Q{i}') for i in range(answers))
+        for quiz in quizzes
+    }
+
+    oldest = timezone.now() - timedelta(days=400 + 31 * months)
+    rng = random.Random(42)
+    batch = 2000
+    for start in range(0, submissions, batch):
+        rows = QuizSubmission.objects.bulk_create(
+            QuizSubmission(
+                user=rng.choice(people), quiz=rng.choice(quizzes),
+                score=rng.randint(0, answers), total_questions=answers,
+            )
+            for _ in range(min(batch, submissions - start))
+        )
+        UserAnswer.objects.bulk_create(
+            UserAnswer(
+                submission=row, question=question,
+                selected_option=rng.randint(1, 4), is_correct=rng.random() < 0.5,
+            )
+            for row in rows for question in questions[row.quiz_id]
+        )
+    # auto_now_add ignores assigned values, so spread the dates afterwards.
+    for index, pk in enumerate(QuizSubmission.objects.order_by('pk').values_list('pk', flat=True)):
+        if index % batch == 0:
+            QuizSubmission.objects.filter(pk__gte=pk, pk__lt=pk + batch).update(
+                submitted_at=oldest + timedelta(days=(index * 31 * months) // submissions)
+            )
+    return people
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--submissions', type=int, default=50000)
+    parser.add_argument('--answers', type=int, default=10, help='Answers per submission.')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--months', type=int, default=6)
+    parser.add_argument('--block-rows', type=int, default=1000)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import override_settings
+
+    with test_database(), tempfile.TemporaryDirectory() as root, \
+            override_settings(ARCHIVE_ROOT=root, ARCHIVE_BLOCK_ROWS=args.block_rows):
+        from core import archive
+        from core.models import ArchiveSegment
+
+        people = build_dataset(args.submissions, args.answers, args.users, args.months)
+
+        started = time.perf_counter()
+        segments = [archive.archive_month(month) for month in archive.months_to_archive()]
+        write_seconds = time.perf_counter() - started
+        archived = sum(segment.submission_count for segment in segments)
+        raw = sum(segment.raw_bytes for segment in segments)
+        stored = sum(segment.stored_bytes for segment in segments)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        rows = answers = 0
+        for row in archive.iter_archived(ArchiveSegment.objects.order_by('month', 'part')):
+            rows += 1
+            answers += len(row.answers)
+        scan_seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rng = random.Random(7)
+        latencies = []
+        for user in rng.sample(people, min(args.lookups, len(people))):
+            started = time.perf_counter()
+            archive.user_submissions(user.pk)
+            latencies.append(time.perf_counter() - started)
+
+        print(f'segments            {len(segments)} ({args.block_rows} submissions per block)')
+        print(f'archive write       {archived / write_seconds:,.0f} submissions/s ({write_seconds:.2f} s)')
+        print(f'compression         {raw / 1024 / 1024:.1f} MiB raw -> {stored / 1024 / 1024:.1f} MiB '
+              f'({raw / stored:.1f}x)')
+        print(f'full scan           {rows / scan_seconds:,.0f} submissions/s, {answers / scan_seconds:,.0f} answers/s')
+        print(f'scan peak memory    {peak / 1024 / 1024:.1f} MiB')
+        print(f'user lookup         p50 {percentile(latencies, 0.5) * 1000:.2f} ms, '
+              f'p99 {percentile(latencies, 0.99) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
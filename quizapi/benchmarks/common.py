@@ -0,0 +1,48 @@
+"""Shared setup for the scripts in ``benchmarks/``.
+
+Run the scripts from the ``quizapi`` project directory, e.g.
+``python benchmarks/sse_loadtest.py``.  They build a throwaway test
+database, so they never touch ``db.sqlite3``.
+"""
+import contextlib
+import os
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(settings_module='quizapi.settings'):
+    if str(PROJECT_DIR) not in sys.path:
+        sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database(name=None):
+    """A throwaway test database; ``name`` puts it in a file instead of memory.
+
+    SQLite's shared in-memory database fails concurrent writers at once
+    rather than making them wait, so write-heavy concurrent runs need a file.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    if name is not None:
+        connection.settings_dict['TEST']['NAME'] = str(name)
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
@@ -0,0 +1,127 @@
+"""Compare the full settings profile with the lean API-only profile.
+
+For each profile, in fresh subprocesses:
+
+* cold start: time to import Django, run ``django.setup()``, build the
+  WSGI application and resolve the URLconf (median of ``--starts`` runs);
+* resident memory of the worker after cold start;
+* per-request time through the handler for a JWT-authenticated endpoint
+  and for a rejected (401) request, plus the share of it spent in
+  middleware (the same request dispatched straight to the view).
+
+    python benchmarks/profile_overhead.py
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+PROFILES = {
+    'full': 'quizapi.settings',
+    'api': 'quizapi.settings_api',
+}
+
+
+def rss_kib():
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def cold_start(settings_module):
+    import os
+    started = time.perf_counter()
+    os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    from common import setup_django
+    setup_django(settings_module)
+    from django.core.wsgi import get_wsgi_application
+    from django.urls import get_resolver
+    get_wsgi_application()
+    get_resolver().url_patterns
+    return {'seconds': time.perf_counter() - started, 'rss_kib': rss_kib(), 'modules': len(sys.modules)}
+
+
+def requests(settings_module, count):
+    from common import setup_django, test_database
+    setup_django(settings_module)
+    from django.core.wsgi import get_wsgi_application
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    with test_database():
+        from core.models import CustomUser
+        from core.views import TestAuthView
+
+        user = CustomUser.objects.create_user('bench', password='x')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+        application = get_wsgi_application()
+        view = TestAuthView.as_view()
+        factory = RequestFactory()
+        environ = factory.get('/api/test-auth/').environ
+
+        def wsgi_get(**extra):
+            b''.join(application({**environ, **extra}, lambda status, headers: None))
+
+        def timed(fn):
+            for _ in range(min(50, count)):
+                fn()
+            started = time.perf_counter()
+            for _ in range(count):
+                fn()
+            return (time.perf_counter() - started) / count * 1e6
+
+        through_handler = timed(lambda: wsgi_get(**auth))
+        rejected = timed(lambda: wsgi_get())
+        direct = timed(lambda: view(factory.get('/api/test-auth/', **auth)))
+    return {
+        'authenticated_us': through_handler,
+        'rejected_us': rejected,
+        'view_only_us': direct,
+        'middleware_us': through_handler - direct,
+    }
+
+
+def run_worker(mode, settings_module, count):
+    output = subprocess.run(
+        [sys.executable, __file__, '--worker', mode, settings_module, '--requests', str(count)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--starts', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'SETTINGS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        mode, settings_module = args.worker
+        result = cold_start(settings_module) if mode == 'start' else requests(settings_module, args.requests)
+        print(json.dumps(result))
+        return
+
+    print(f"{'profile':<8} {'cold start ms':>13} {'RSS MiB':>8} {'modules':>8} "
+          f"{'auth req us':>12} {'401 req us':>11} {'middleware us':>14}")
+    for name, settings_module in PROFILES.items():
+        starts = [run_worker('start', settings_module, 0) for _ in range(args.starts)]
+        timing = run_worker('requests', settings_module, args.requests)
+        print(
+            f"{name:<8} {statistics.median(s['seconds'] for s in starts) * 1000:>13.1f} "
+            f"{statistics.median(s['rss_kib'] for s in starts) / 1024:>8.1f} "
+            f"{starts[0]['modules']:>8} {timing['authenticated_us']:>12.0f} "
+            f"{timing['rejected_us']:>11.0f} {timing['middleware_us']:>14.0f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
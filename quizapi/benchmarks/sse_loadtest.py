@@ -0,0 +1,163 @@
+"""Load test for the live quiz feed (``quizzes/<id>/live/``).
+
+Drives the real ASGI application in-process: every subscriber is a full
+ASGI HTTP request against the SSE endpoint, so authentication, routing,
+the streaming response and the broadcaster are all exercised without a
+network server.  For each subscriber count it reports connect time,
+memory per subscriber, and how long a new submission takes to reach
+every subscriber.
+
+The live quiz starts with ``--history`` earlier submissions and one more
+client watches a quiz nobody has submitted to, so the report also shows
+what a poll tick with nothing new costs when busy and quiet quizzes are
+subscribed side by side.
+
+    python benchmarks/sse_loadtest.py --subscribers 100 1000 5000 --history 5000
+"""
+import argparse
+import asyncio
+import gc
+import time
+import tracemalloc
+
+from common import percentile, setup_django, test_database
+
+
+class Client:
+    def __init__(self, app, path, token):
+        self.app = app
+        self.scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+            'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+            'query_string': f'token={token}'.encode(), 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'accept', b'text/event-stream')],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        self.disconnected = asyncio.Event()
+        self.connected = asyncio.Event()
+        self.status = None
+        self.received = {}
+        self.waiters = {}
+
+    async def receive(self):
+        if not hasattr(self, '_sent_body'):
+            self._sent_body = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            body = message.get('body', b'')
+            if b'event: leaderboard' in body:
+                self.connected.set()
+            for line in body.split(b'\n'):
+                if line.startswith(b'id: '):
+                    submission_id = int(line[4:])
+                    self.received[submission_id] = time.perf_counter()
+                    waiter = self.waiters.pop(submission_id, None)
+                    if waiter:
+                        waiter.set()
+
+    async def wait_for(self, submission_id):
+        if submission_id in self.received:
+            return
+        event = self.waiters.setdefault(submission_id, asyncio.Event())
+        await event.wait()
+
+    async def run(self):
+        await self.app(self.scope, self.receive, self.send)
+
+
+async def run_round(app, quiz, quiet_quiz, token, count, submit_user):
+    from asgiref.sync import sync_to_async
+    from core.broadcast import _poll, broadcaster
+    from core.models import QuizSubmission
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    clients = [Client(app, f'/api/quizzes/{quiz.pk}/live/', token) for _ in range(count)]
+    quiet = Client(app, f'/api/quizzes/{quiet_quiz.pk}/live/', token)
+    tasks = [asyncio.create_task(client.run()) for client in clients + [quiet]]
+    await asyncio.gather(*(client.connected.wait() for client in clients + [quiet]))
+    connect_seconds = time.perf_counter() - started
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    per_subscriber = sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / count
+
+    latencies = []
+    for _ in range(5):
+        submission = await sync_to_async(QuizSubmission.objects.create)(
+            user=submit_user, quiz=quiz, score=1, total_questions=1
+        )
+        published = time.perf_counter()
+        broadcaster.notify()
+        await asyncio.gather(*(client.wait_for(submission.pk) for client in clients))
+        latencies.extend(client.received[submission.pk] - published for client in clients)
+
+    idle_polls = []
+    for _ in range(5):
+        started = time.perf_counter()
+        await sync_to_async(_poll)(dict(broadcaster._cursors), dict(broadcaster._versions))
+        idle_polls.append(time.perf_counter() - started)
+
+    for client in clients + [quiet]:
+        client.disconnected.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    while broadcaster.subscriber_count:
+        await asyncio.sleep(0.01)
+
+    return {
+        'subscribers': count,
+        'connect_s': connect_seconds,
+        'kib_per_sub': per_subscriber / 1024,
+        'fanout_p50_ms': percentile(latencies, 0.5) * 1000,
+        'fanout_p99_ms': percentile(latencies, 0.99) * 1000,
+        'idle_poll_ms': percentile(idle_polls, 0.5) * 1000,
+        'statuses': {client.status for client in clients},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[100, 1000, 2000])
+    parser.add_argument('--history', type=int, default=5000, help='Earlier submissions to the live quiz.')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.asgi import get_asgi_application
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    with test_database():
+        from core.models import Category, CustomUser, Quiz, QuizSubmission
+
+        admin = CustomUser.objects.create_user('bench-admin', password='x', role='admin')
+        viewer = CustomUser.objects.create_user('bench-viewer', password='x')
+        category = Category.objects.create(name='Bench')
+        quiz = Quiz.objects.create(title='Live', category=category, created_by=admin)
+        quiet_quiz = Quiz.objects.create(title='Quiet', category=category, created_by=admin)
+        QuizSubmission.objects.bulk_create(
+            QuizSubmission(user=viewer, quiz=quiz, score=0, total_questions=1) for _ in range(args.history)
+        )
+        token = str(AccessToken.for_user(viewer))
+        app = get_asgi_application()
+
+        print(f"{'subscribers':>11} {'connect s':>10} {'KiB/sub':>8} {'fanout p50 ms':>14} {'fanout p99 ms':>14} "
+              f"{'idle poll ms':>12}")
+        for count in args.subscribers:
+            result = asyncio.run(run_round(app, quiz, quiet_quiz, token, count, admin))
+            print(
+                f"{result['subscribers']:>11} {result['connect_s']:>10.2f} {result['kib_per_sub']:>8.1f} "
+                f"{result['fanout_p50_ms']:>14.1f} {result['fanout_p99_ms']:>14.1f} "
+                f"{result['idle_poll_ms']:>12.1f}"
+                + ('' if result['statuses'] == {200} else f"  statuses={result['statuses']}")
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""Latency of well-behaved clients while other clients abuse login and submit.
+
+Requests go through the real WSGI application, served by a fixed pool of
+``--workers`` threads that stand in for a server's worker capacity.  Two
+endpoints are exercised:
+
+login
+    ``--abusers`` concurrent connections spread over ``--abuser-ips``
+    addresses send bad-password logins back to back (a retry storm or a
+    small credential-stuffing run), while well-behaved users log in
+    correctly, one every 250 ms, each from its own address.
+
+submit
+    The same number of connections, logged in as ``--abuser-accounts``
+    accounts, resubmit one quiz back to back, while well-behaved users
+    (a fresh account each) submit the same quiz every 250 ms.  Every
+    submission also draws from the quiz-wide ``quiz_submissions`` bucket,
+    so abuse that drained it would throttle everyone else too.
+
+Each endpoint is run without abuse, with abuse and throttling disabled, and
+with abuse and throttling enabled; the report shows the good requests'
+latency (queueing included) and what happened to the abuse.
+
+    python benchmarks/throttle_loadtest.py --workers 4 --abusers 16 --warmup 15 --seconds 15
+"""
+import argparse
+import itertools
+import json
+import logging
+import queue
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from common import percentile, setup_django, test_database
+
+
+class WorkerPool:
+    def __init__(self, application, workers):
+        self.application = application
+        self.requests = queue.Queue()
+        self.threads = [threading.Thread(target=self.serve, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def serve(self):
+        from django.db import close_old_connections
+        while True:
+            environ, done = self.requests.get()
+            if environ is None:
+                return
+            statuses = []
+            body = self.application(environ, lambda status, headers: statuses.append(status))
+            b''.join(body)
+            close_old_connections()
+            done(int(statuses[0].split()[0]))
+
+    def call(self, environ):
+        finished = threading.Event()
+        result = {}
+
+        def done(status):
+            result['status'] = status
+            finished.set()
+
+        self.requests.put((environ, done))
+        finished.wait()
+        return result['status']
+
+    def stop(self):
+        for _ in self.threads:
+            self.requests.put((None, None))
+
+
+def post_environ(path, data, ip, token=None):
+    from django.test import RequestFactory
+    extra = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+    return RequestFactory().post(
+        path, data=json.dumps(data), content_type='application/json', REMOTE_ADDR=ip, **extra
+    ).environ
+
+
+class LoginTraffic:
+    good_status = 200
+
+    def __init__(self, args):
+        self.args = args
+
+    def start(self):
+        pass
+
+    def abuse(self, number, attempt):
+        return post_environ('/api/login/', {'username': f'guess-{number}-{attempt}', 'password': 'wrong'},
+                            f'10.0.1.{number % self.args.abuser_ips}')
+
+    def good(self, number):
+        return post_environ('/api/login/', {'username': f'good-{number % self.args.users}',
+                                            'password': 'correct-horse'},
+                            f'10.0.{2 + number // 250}.{number % 250}')
+
+
+class SubmitTraffic:
+    good_status = 201
+
+    def __init__(self, args):
+        from core.models import CustomUser
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        self.args = args
+        self.abuser_tokens = [
+            str(RefreshToken.for_user(CustomUser.objects.create_user(f'abuser-{number}')).access_token)
+            for number in range(args.abuser_accounts)
+        ]
+        self.players = itertools.count()
+        self.lock = threading.Lock()
+
+    def start(self):
+        # A fresh quiz per scenario, so earlier submissions do not count.
+        from core.models import Category, CustomUser, Quiz
+        from rest_framework_simplejwt.tokens import RefreshToken
+
+        self.quiz = Quiz.objects.create(
+            title='Load test', category=Category.objects.get_or_create(name='Load test')[0],
+            created_by=CustomUser.objects.get_or_create(username='load-admin', defaults={'role': 'admin'})[0],
+        )
+        # Enough fresh accounts for one submission every 250 ms.
+        self.good_tokens = [
+            str(RefreshToken.for_user(
+                CustomUser.objects.create_user(f'player-{next(self.players)}')
+            ).access_token)
+            for _ in range(int(self.args.seconds * 4) + 4)
+        ]
+
+    def submit(self, token, ip):
+        return post_environ(f'/api/quizzes/{self.quiz.pk}/submit/', {'user_answers': []}, ip, token)
+
+    def abuse(self, number, attempt):
+        return self.submit(self.abuser_tokens[number % len(self.abuser_tokens)], f'10.0.1.{number}')
+
+    def good(self, number):
+        return self.submit(self.good_tokens[number], f'10.0.{2 + number // 250}.{number % 250}')
+
+
+def run_scenario(application, args, traffic, abusers, throttled):
+    from django.test import override_settings
+    from core.models import ThrottleBucket
+
+    ThrottleBucket.objects.all().delete()
+    traffic.start()
+    pool = WorkerPool(application, args.workers)
+    stop = threading.Event()
+    abuse = Counter()
+
+    def abuser(number):
+        attempt = 0
+        while not stop.is_set():
+            attempt += 1
+            abuse[pool.call(traffic.abuse(number, attempt))] += 1
+
+    latencies = []
+    good = Counter()
+    with override_settings(THROTTLE_ENABLED=throttled):
+        threads = [threading.Thread(target=abuser, args=(number,)) for number in range(abusers)]
+        for thread in threads:
+            thread.start()
+        if abusers:
+            # Let the abuse use up its burst so the numbers show the steady state.
+            time.sleep(args.warmup)
+        deadline = time.perf_counter() + args.seconds
+        number = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            status = pool.call(traffic.good(number))
+            number += 1
+            latencies.append(time.perf_counter() - started)
+            good[status] += 1
+            time.sleep(max(0.0, 0.25 - (time.perf_counter() - started)))
+        stop.set()
+        for thread in threads:
+            thread.join()
+    pool.stop()
+    return latencies, good, abuse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--abusers', type=int, default=16)
+    parser.add_argument('--abuser-ips', type=int, default=2)
+    parser.add_argument('--abuser-accounts', type=int, default=2)
+    parser.add_argument('--users', type=int, default=100, help='Well-behaved login accounts.')
+    parser.add_argument('--warmup', type=float, default=15, help='Seconds of abuse before measuring.')
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--endpoint', choices=('login', 'submit', 'both'), default='both')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.wsgi import get_wsgi_application
+
+    # Every request writes its throttle buckets, which needs a file database.
+    with tempfile.TemporaryDirectory() as directory, test_database(Path(directory) / 'loadtest.sqlite3'):
+        from core.models import CustomUser
+        for number in range(args.users):
+            CustomUser.objects.create_user(f'good-{number}', password='correct-horse')
+        application = get_wsgi_application()
+        # Every rejected request would otherwise log a warning.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        print(f"{'scenario':<28} {'good p50 ms':>11} {'good p99 ms':>11} {'good ok':>8} "
+              f"{'abuse req/s':>11} {'abuse 429':>9}")
+        for endpoint, traffic_class in (('login', LoginTraffic), ('submit', SubmitTraffic)):
+            if args.endpoint not in (endpoint, 'both'):
+                continue
+            traffic = traffic_class(args)
+            for label, abusers, throttled in (
+                ('no abuse', 0, True),
+                ('abuse, unthrottled', args.abusers, False),
+                ('abuse, throttled', args.abusers, True),
+            ):
+                latencies, good, abuse = run_scenario(application, args, traffic, abusers, throttled)
+                total_abuse = sum(abuse.values())
+                print(
+                    f"{endpoint + ': ' + label:<28} {percentile(latencies, 0.5) * 1000:>11.0f} "
+                    f"{percentile(latencies, 0.99) * 1000:>11.0f} "
+                    f"{good[traffic.good_status]:>4}/{sum(good.values()):<3} "
+                    f"{total_abuse / (args.seconds + args.warmup):>11.1f} "
+                    f"{(abuse[429] / total_abuse if total_abuse else 0):>9.0%}"
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.db.models import Sum
+from . import analytics, broadcast, bulk, counters, history, purge
 from .models import CustomUser, Category, Quiz, Question, QuizSubmission, UserAnswer
 
 class CustomUserAdmin(UserAdmin):
@@ -9,9 +11,130 @@ class CustomUserAdmin(UserAdmin):
         ('Role', {'fields': ('role',)}),
     )
 
+class SoftDeleteAdmin(admin.ModelAdmin):
+    """Deletes go through the same soft delete and purge job as the API.
+
+    The confirmation page and the ``delete_selected`` action list what will
+    go from the stored counters instead of walking the cascade, which would
+    load every question, option, submission and answer in the request.
+    """
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        model_count = {self.opts.verbose_name_plural: len(objs)}
+        for model, count in self.purged_counts(objs).items():
+            model_count[model._meta.verbose_name_plural] = count
+        return [str(obj) for obj in objs], model_count, set(), []
+
+    def purged_counts(self, objs):
+        """``{model: rows}`` the purge job will remove along with ``objs``."""
+        raise NotImplementedError
+
+    @staticmethod
+    def quiz_totals(quizzes):
+        totals = quizzes.aggregate(questions=Sum('question_count'), submissions=Sum('submission_count'))
+        return {Question: totals['questions'] or 0, QuizSubmission: totals['submissions'] or 0}
+
+class CategoryAdmin(SoftDeleteAdmin):
+    readonly_fields = ('deleted_at', 'quiz_count')
+
+    def purged_counts(self, objs):
+        return {
+            Quiz: sum(category.quiz_count for category in objs),
+            **self.quiz_totals(Quiz.objects.filter(category__in=objs)),
+        }
+
+    def delete_model(self, request, obj):
+        purge.soft_delete_category(obj, request.user)
+        history.bump_global()
+
+    def delete_queryset(self, request, queryset):
+        for category in queryset:
+            purge.soft_delete_category(category, request.user)
+        history.bump_global()
+
+class QuizAdmin(SoftDeleteAdmin):
+    readonly_fields = (
+        'deleted_at', 'question_count', 'active_question_count', 'submission_count', 'score_sum',
+    )
+
+    def purged_counts(self, objs):
+        return self.quiz_totals(Quiz.objects.filter(pk__in=[quiz.pk for quiz in objs]))
+
+    # The admin saves inside its own transaction, so the counter updates
+    # commit or roll back with the row like they do in the serializers.
+    def save_model(self, request, obj, form, change):
+        old_category_id = form.initial.get('category') if change else None
+        super().save_model(request, obj, form, change)
+        if change:
+            counters.quiz_moved(old_category_id, obj)
+        else:
+            counters.quiz_added(obj)
+
+    def delete_model(self, request, obj):
+        purge.soft_delete_quiz(obj, request.user)
+        history.bump_global()
+
+    def delete_queryset(self, request, queryset):
+        purge.soft_delete_quizzes(queryset, request.user)
+        history.bump_global()
+
+class QuestionAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        if change:
+            old_quiz_id, old_is_active = form.initial['quiz'], form.initial['is_active']
+        super().save_model(request, obj, form, change)
+        if change:
+            counters.question_changed(old_quiz_id, old_is_active, obj)
+        else:
+            counters.question_added(obj)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        counters.question_removed(obj)
+        broadcast.mark_changed([obj.quiz_id])
+
+    def delete_queryset(self, request, queryset):
+        bulk.delete_questions(queryset)
+
+class QuizSubmissionAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = QuizSubmission.objects.get(pk=obj.pk)
+        super().save_model(request, obj, form, change)
+        deltas = analytics.new_deltas()
+        if change:
+            self.removed(old, deltas)
+        self.added(obj, deltas)
+        analytics.apply_deltas(deltas)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        deltas = analytics.new_deltas()
+        self.removed(obj, deltas)
+        analytics.apply_deltas(deltas)
+
+    def delete_queryset(self, request, queryset):
+        submissions = list(queryset)
+        super().delete_queryset(request, queryset)
+        deltas = analytics.new_deltas()
+        for submission in submissions:
+            self.removed(submission, deltas)
+        analytics.apply_deltas(deltas)
+
+    def added(self, submission, deltas, sign=1):
+        counters.submission_added(submission, sign)
+        analytics.add_to_deltas(deltas, submission.quiz_id, submission.submitted_at,
+                                submission.score, submission.total_questions, sign=sign)
+        history.bump_user(submission.user_id)
+        broadcast.mark_changed([submission.quiz_id])
+
+    def removed(self, submission, deltas):
+        self.added(submission, deltas, sign=-1)
+
 admin.site.register(CustomUser, CustomUserAdmin)
-admin.site.register(Category)
-admin.site.register(Quiz)
-admin.site.register(Question)
-admin.site.register(QuizSubmission)
-admin.site.register(UserAnswer)
\ No newline at end of file
+admin.site.register(Category, CategoryAdmin)
+admin.site.register(Quiz, QuizAdmin)
+admin.site.register(Question, QuestionAdmin)
+admin.site.register(QuizSubmission, QuizSubmissionAdmin)
+admin.site.register(UserAnswer)
@@ -0,0 +1,154 @@
+"""Incrementally maintained score analytics.
+
+Every graded submission contributes one unit to a ``QuizScoreRollup`` row
+keyed by (quiz, day, score bucket).  Regrades move that unit between buckets
+with a -1/+1 delta, so the rollups never need a full rebuild and the
+analytics endpoints only ever read the (small) rollup table.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import QuizScoreRollup
+
+BUCKET_COUNT = 10
+BUCKET_WIDTH = 100 // BUCKET_COUNT
+
+
+def pass_percentage():
+    return getattr(settings, 'QUIZ_PASS_PERCENTAGE', 60)
+
+
+def score_percent(score, total_questions):
+    if not total_questions:
+        return 0
+    return round(score * 100 / total_questions)
+
+
+def bucket_for(percent):
+    return min(percent // BUCKET_WIDTH, BUCKET_COUNT - 1)
+
+
+def bucket_label(bucket):
+    low = bucket * BUCKET_WIDTH
+    high = 100 if bucket == BUCKET_COUNT - 1 else low + BUCKET_WIDTH - 1
+    return f"{low}-{high}"
+
+
+def rollup_key(quiz_id, submitted_at, score, total_questions):
+    percent = score_percent(score, total_questions)
+    return (quiz_id, timezone.localdate(submitted_at), bucket_for(percent)), percent
+
+
+def apply_deltas(deltas):
+    """Apply ``{(quiz_id, day, bucket): [count, score_sum, percent_sum, pass_count]}``.
+
+    Each key is one ``UPDATE ... SET col = col + delta``; a missing row is
+    created first so concurrent writers never lose an increment.
+    """
+    with transaction.atomic():
+        for (quiz_id, day, bucket), (count, score_sum, percent_sum, passed) in deltas.items():
+            if not (count or score_sum or percent_sum or passed):
+                continue
+            rows = QuizScoreRollup.objects.filter(quiz_id=quiz_id, day=day, bucket=bucket)
+            changes = {
+                'submission_count': F('submission_count') + count,
+                'score_sum': F('score_sum') + score_sum,
+                'percent_sum': F('percent_sum') + percent_sum,
+                'pass_count': F('pass_count') + passed,
+            }
+            if not rows.update(**changes):
+                QuizScoreRollup.objects.get_or_create(quiz_id=quiz_id, day=day, bucket=bucket)
+                rows.update(**changes)
+
+
+def add_to_deltas(deltas, quiz_id, submitted_at, score, total_questions, sign=1):
+    key, percent = rollup_key(quiz_id, submitted_at, score, total_questions)
+    passed = 1 if percent >= pass_percentage() else 0
+    row = deltas[key]
+    row[0] += sign
+    row[1] += sign * score
+    row[2] += sign * percent
+    row[3] += sign * passed
+
+
+def new_deltas():
+    return defaultdict(lambda: [0, 0, 0, 0])
+
+
+def record_submission(submission):
+    deltas = new_deltas()
+    add_to_deltas(deltas, submission.quiz_id, submission.submitted_at,
+                  submission.score, submission.total_questions)
+    apply_deltas(deltas)
+
+
+def record_regrade(submission, old_score, deltas=None):
+    """Move a regraded submission from its old bucket to its new one."""
+    own = deltas is None
+    if own:
+        deltas = new_deltas()
+    add_to_deltas(deltas, submission.quiz_id, submission.submitted_at,
+                  old_score, submission.total_questions, sign=-1)
+    add_to_deltas(deltas, submission.quiz_id, submission.submitted_at,
+                  submission.score, submission.total_questions)
+    if own:
+        apply_deltas(deltas)
+    return deltas
+
+
+def summarize(rollups):
+    """Build the analytics payload from a ``QuizScoreRollup`` queryset."""
+    histogram = Counter()
+    by_day = defaultdict(lambda: [0, 0, 0])
+    for day, bucket, count, percent_sum, passed in rollups.values_list(
+        'day', 'bucket', 'submission_count', 'percent_sum', 'pass_count'
+    ):
+        histogram[bucket] += count
+        row = by_day[day]
+        row[0] += count
+        row[1] += percent_sum
+        row[2] += passed
+
+    total = sum(histogram.values())
+    percent_total = sum(row[1] for row in by_day.values())
+    passed_total = sum(row[2] for row in by_day.values())
+    return {
+        'pass_percentage': pass_percentage(),
+        'submissions': total,
+        'mean_percent': round(percent_total / total, 2) if total else None,
+        'median_percent': _histogram_median(histogram, total),
+        'pass_rate': round(passed_total / total, 4) if total else None,
+        'histogram': [
+            {'bucket': bucket_label(bucket), 'count': histogram.get(bucket, 0)}
+            for bucket in range(BUCKET_COUNT)
+        ],
+        'by_day': [
+            {
+                'day': day,
+                'submissions': count,
+                'mean_percent': round(percent_sum / count, 2) if count else None,
+                'pass_rate': round(passed / count, 4) if count else None,
+            }
+            for day, (count, percent_sum, passed) in sorted(by_day.items())
+        ],
+    }
+
+
+def _histogram_median(histogram, total):
+    # Linear interpolation inside the bucket that holds the middle submission.
+    if not total:
+        return None
+    midpoint = total / 2
+    seen = 0
+    for bucket in range(BUCKET_COUNT):
+        count = histogram.get(bucket, 0)
+        if count and seen + count >= midpoint:
+            width = BUCKET_WIDTH + (1 if bucket == BUCKET_COUNT - 1 else 0)
+            return round(bucket * BUCKET_WIDTH + (midpoint - seen) / count * width, 2)
+        seen += count
+    return None
+
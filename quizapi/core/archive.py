@@ -0,0 +1,351 @@
+"""Monthly cold-storage segments for old submissions and their answers.
+
+``archive_month`` moves every submission of one calendar month (and its
+``UserAnswer`` rows) into a segment on local disk and deletes the hot rows
+in the same transaction that records the ``ArchiveSegment``.
+
+A segment is two files under ``ARCHIVE_ROOT``:
+
+``<month>.<part>.qarc``
+    A sequence of independently zlib-compressed blocks of up to
+    ``ARCHIVE_BLOCK_ROWS`` submissions each.  Inside a block every
+    submission is a fixed ``SUBMISSION`` struct followed by
+    ``answer_count`` ``ANSWER`` structs.
+
+``<month>.<part>.qidx``
+    The per-segment index (zlib-compressed JSON): the byte range and id
+    range of every block, and for every user the blocks holding their
+    submissions and the quizzes they submitted.  Rows are clustered by
+    user, so one user's submissions usually share a single block.
+
+Readers decompress one block at a time, so memory stays bounded by the
+block size no matter how large a segment is; user lookups only touch the
+blocks the index points at.  Parsed indexes are kept in a per-process
+cache of at most ``ARCHIVE_INDEX_CACHE_BYTES``.
+"""
+import json
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchiveSegment, QuizSubmission, UserAnswer
+
+SUBMISSION = struct.Struct('<QQQiiqH')
+ANSWER = struct.Struct('<QqB')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+ArchivedSubmission = namedtuple(
+    'ArchivedSubmission', 'id user_id quiz_id score total_questions submitted_at answers'
+)
+ArchivedAnswer = namedtuple('ArchivedAnswer', 'question_id selected_option is_correct')
+
+
+def archive_root():
+    return Path(getattr(settings, 'ARCHIVE_ROOT', Path(settings.BASE_DIR) / 'archive'))
+
+
+def block_rows():
+    return getattr(settings, 'ARCHIVE_BLOCK_ROWS', 1000)
+
+
+def archive_cutoff(now=None):
+    """Start of the newest month that is entirely older than ``ARCHIVE_AFTER_DAYS``."""
+    now = now or timezone.now()
+    oldest_hot = timezone.localtime(now - timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 365)))
+    return month_start(oldest_hot)
+
+
+def month_start(value):
+    return timezone.make_aware(datetime(value.year, value.month, 1))
+
+
+def next_month(start):
+    return timezone.make_aware(datetime(start.year + start.month // 12, start.month % 12 + 1, 1))
+
+
+def to_micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+def pack_submission(row, answers):
+    submission_id, user_id, quiz_id, score, total_questions, submitted_at = row
+    parts = [SUBMISSION.pack(
+        submission_id, user_id, quiz_id, score, total_questions, to_micros(submitted_at), len(answers)
+    )]
+    parts.extend(ANSWER.pack(question_id, selected_option, is_correct)
+                 for question_id, selected_option, is_correct in answers)
+    return b''.join(parts)
+
+
+def unpack_block(data, user_id=None):
+    """Decode a block; with ``user_id`` other users' rows are skipped undecoded."""
+    offset = 0
+    end = len(data)
+    while offset < end:
+        submission_id, row_user, quiz_id, score, total, micros, answer_count = SUBMISSION.unpack_from(data, offset)
+        offset += SUBMISSION.size
+        answers_end = offset + answer_count * ANSWER.size
+        if user_id is None or row_user == user_id:
+            answers = tuple(
+                ArchivedAnswer(question_id, selected_option, bool(is_correct))
+                for question_id, selected_option, is_correct in ANSWER.iter_unpack(data[offset:answers_end])
+            )
+            yield ArchivedSubmission(submission_id, row_user, quiz_id, score, total, from_micros(micros), answers)
+        offset = answers_end
+
+
+def months_to_archive(cutoff=None):
+    cutoff = cutoff or archive_cutoff()
+    dates = (
+        QuizSubmission.objects.filter(submitted_at__lt=cutoff)
+        .dates('submitted_at', 'month', order='ASC')
+    )
+    return [timezone.make_aware(datetime(day.year, day.month, 1)) for day in dates]
+
+
+def archive_month(start):
+    """Archive every hot submission submitted in the month beginning at ``start``."""
+    end = next_month(start)
+    month = start.strftime('%Y-%m')
+    submissions = QuizSubmission.objects.filter(
+        submitted_at__gte=start, submitted_at__lt=end, quiz__deleted_at__isnull=True
+    )
+    last_id = submissions.order_by('pk').values_list('pk', flat=True).last()
+    if last_id is None:
+        return None
+
+    part = ArchiveSegment.objects.filter(month=month).count()
+    name = f'{month}.{part}'
+    root = archive_root()
+    root.mkdir(parents=True, exist_ok=True)
+    data_path, index_path = root / f'{name}.qarc', root / f'{name}.qidx'
+
+    index = {'blocks': [], 'users': {}}
+    quiz_totals = {}
+    counts = {'submissions': 0, 'answers': 0, 'raw_bytes': 0}
+    size = block_rows()
+    # Rows are clustered by user so a user's history sits in one or two
+    # blocks per segment; pages are walked with a (user_id, pk) keyset.
+    ordered = submissions.filter(pk__lte=last_id).order_by('user_id', 'pk')
+    with open_for_write(data_path) as data_file:
+        page = ordered
+        while True:
+            rows = list(page.values_list(
+                'pk', 'user_id', 'quiz_id', 'score', 'total_questions', 'submitted_at'
+            )[:size])
+            if not rows:
+                break
+            last_pk, last_user = rows[-1][0], rows[-1][1]
+            page = ordered.filter(Q(user_id__gt=last_user) | Q(user_id=last_user, pk__gt=last_pk))
+            write_block(data_file, len(index['blocks']), rows, index, quiz_totals, counts)
+
+    with open_for_write(index_path) as index_file:
+        index_file.write(zlib.compress(json.dumps(index, separators=(',', ':')).encode()))
+
+    with transaction.atomic():
+        segment = ArchiveSegment.objects.create(
+            month=month, part=part, file_name=name,
+            first_submission_id=min(block[2] for block in index['blocks']),
+            last_submission_id=max(block[3] for block in index['blocks']),
+            submission_count=counts['submissions'], answer_count=counts['answers'],
+            block_count=len(index['blocks']), raw_bytes=counts['raw_bytes'],
+            stored_bytes=data_path.stat().st_size + index_path.stat().st_size,
+            quiz_totals=quiz_totals,
+        )
+        archived = submissions.filter(pk__lte=last_id)
+        UserAnswer.objects.filter(submission__in=archived)._raw_delete(router.db_for_write(UserAnswer))
+        archived._raw_delete(router.db_for_write(QuizSubmission))
+    return segment
+
+
+def write_block(data_file, block_number, rows, index, quiz_totals, counts):
+    answers = {}
+    for submission_id, question_id, selected_option, is_correct in (
+        UserAnswer.objects.filter(submission_id__in=[row[0] for row in rows])
+        .order_by('submission_id', 'pk')
+        .values_list('submission_id', 'question_id', 'selected_option', 'is_correct')
+    ):
+        answers.setdefault(submission_id, []).append((question_id, selected_option, is_correct))
+
+    raw = b''.join(pack_submission(row, answers.get(row[0], ())) for row in rows)
+    compressed = zlib.compress(raw, 6)
+    offset = data_file.tell()
+    data_file.write(compressed)
+    ids = [row[0] for row in rows]
+    index['blocks'].append([offset, len(compressed), min(ids), max(ids), len(rows)])
+
+    for submission_id, user_id, quiz_id, score, total_questions, submitted_at in rows:
+        entry = index['users'].setdefault(str(user_id), {'blocks': [], 'quizzes': []})
+        if not entry['blocks'] or entry['blocks'][-1] != block_number:
+            entry['blocks'].append(block_number)
+        if quiz_id not in entry['quizzes']:
+            entry['quizzes'].append(quiz_id)
+        totals = quiz_totals.setdefault(str(quiz_id), [0, 0])
+        totals[0] += 1
+        totals[1] += score
+    counts['submissions'] += len(rows)
+    counts['answers'] += sum(len(value) for value in answers.values())
+    counts['raw_bytes'] += len(raw)
+
+
+class open_for_write:
+    """Write to a temporary file and atomically move it into place on success."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, 'wb')
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.file.close()
+            self.tmp_path.unlink(missing_ok=True)
+            return False
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        return False
+
+
+def index_cache_bytes():
+    return getattr(settings, 'ARCHIVE_INDEX_CACHE_BYTES', 16 * 1024 * 1024)
+
+
+class IndexCache:
+    """Least-recently-used segment indexes, capped by their decompressed size.
+
+    A segment's index grows with its users, so capping by entry count would
+    let per-worker memory grow with users x segments.  The cost of an entry
+    is the length of its decompressed JSON; an index larger than the whole
+    budget is returned uncached.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        stat = path.stat()
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        key = str(path)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                return entry[2]
+        with open(path, 'rb') as index_file:
+            raw = zlib.decompress(index_file.read())
+        index = json.loads(raw)
+        with self.lock:
+            self.discard(key)
+            if len(raw) <= index_cache_bytes():
+                self.entries[key] = (stamp, len(raw), index)
+                self.size += len(raw)
+                while self.size > index_cache_bytes():
+                    self.discard(next(iter(self.entries)))
+        return index
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+index_cache = IndexCache()
+
+
+def load_index(segment):
+    return index_cache.get(archive_root() / f'{segment.file_name}.qidx')
+
+
+def iter_segment(segment, blocks=None, user_id=None):
+    """Yield the ``ArchivedSubmission`` rows of a segment, one block in memory at a time."""
+    directory = load_index(segment)['blocks']
+    numbers = range(len(directory)) if blocks is None else blocks
+    with open(archive_root() / f'{segment.file_name}.qarc', 'rb') as data_file:
+        for number in numbers:
+            offset, length = directory[number][:2]
+            data_file.seek(offset)
+            yield from unpack_block(zlib.decompress(data_file.read(length)), user_id)
+
+
+def segment_span(segment):
+    """``(start, end)`` of the month a segment holds."""
+    year, month = map(int, segment.month.split('-'))
+    start = timezone.make_aware(datetime(year, month, 1))
+    return start, next_month(start)
+
+
+def iter_archived(segments=None, quiz_id=None, since=None, until=None):
+    """Archived submissions, optionally of one quiz and within ``[since, until)``.
+
+    Segments of months outside the range, or whose ``quiz_totals`` do not
+    list the quiz, are skipped without opening their files.
+    """
+    segments = ArchiveSegment.objects.order_by('month', 'part') if segments is None else segments
+    for segment in segments:
+        start, end = segment_span(segment)
+        if (since is not None and end <= since) or (until is not None and start >= until):
+            continue
+        if quiz_id is not None and str(quiz_id) not in segment.quiz_totals:
+            continue
+        for row in iter_segment(segment):
+            if quiz_id is not None and row.quiz_id != quiz_id:
+                continue
+            if since is not None and row.submitted_at < since:
+                continue
+            if until is not None and row.submitted_at >= until:
+                continue
+            yield row
+
+
+def user_submissions(user_id):
+    """Archived submissions of one user, reading only the blocks the indexes list."""
+    rows = []
+    for segment in ArchiveSegment.objects.order_by('month', 'part'):
+        entry = load_index(segment)['users'].get(str(user_id))
+        if entry:
+            rows.extend(iter_segment(segment, entry['blocks'], user_id))
+    return rows
+
+
+def has_submission(user_id, quiz_id):
+    segments = ArchiveSegment.objects.filter(quiz_totals__has_key=str(quiz_id)).order_by('-month', '-part')
+    for segment in segments:
+        entry = load_index(segment)['users'].get(str(user_id))
+        if entry and quiz_id in entry['quizzes']:
+            return True
+    return False
+
+
+def quiz_totals():
+    """``{quiz_id: (submission_count, score_sum)}`` over every segment."""
+    totals = {}
+    for segment_totals in ArchiveSegment.objects.values_list('quiz_totals', flat=True):
+        for quiz_id, (count, score_sum) in segment_totals.items():
+            current = totals.get(int(quiz_id), (0, 0))
+            totals[int(quiz_id)] = (current[0] + count, current[1] + score_sum)
+    return totals
@@ -0,0 +1,235 @@
+"""In-process fan-out of live quiz events to server-sent-event subscribers.
+
+Each worker process owns one ``QuizBroadcaster``.  A single poller task per
+worker reads new submissions for every quiz that currently has
+subscribers (one query per tick, however many clients are connected),
+recomputes the leaderboard of quizzes that changed, and pushes the events
+onto each subscriber's bounded queue.  ``notify()`` lets the submit path
+wake the poller immediately instead of waiting for the next tick.
+
+Writes that change a leaderboard without adding a submission (regrades,
+deletes) call ``mark_changed``, which stores a new per-quiz version in the
+shared ``LIVE_FEED_CACHE_ALIAS`` cache.  The poller reads the versions of
+its quizzes with one ``get_many`` per tick and recomputes those that
+moved, so the change reaches subscribers on every worker.
+
+The broadcaster lives on the ASGI event loop; serve the live endpoint
+with an ASGI server so that loop outlives individual requests.
+"""
+import asyncio
+import json
+import logging
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .models import QuizSubmission
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_SIZE = 10
+QUEUE_SIZE = 100
+
+
+def poll_interval():
+    return getattr(settings, 'LIVE_FEED_POLL_INTERVAL', 1.0)
+
+
+def get_cache():
+    return caches[getattr(settings, 'LIVE_FEED_CACHE_ALIAS', 'default')]
+
+
+def version_key(quiz_id):
+    return f'live:version:quiz:{quiz_id}'
+
+
+def mark_changed(quiz_ids):
+    """Have every worker recompute these quizzes' leaderboards after commit."""
+    keys = [version_key(quiz_id) for quiz_id in set(quiz_ids)]
+    if not keys:
+        return
+
+    def bump():
+        get_cache().set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+        broadcaster.notify()
+
+    transaction.on_commit(bump)
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def submission_event(submission):
+    return {
+        'id': submission.id,
+        'user': submission.user_id,
+        'username': submission.user.username,
+        'score': submission.score,
+        'total_questions': submission.total_questions,
+        'submitted_at': submission.submitted_at,
+    }
+
+
+def leaderboard(quiz_id):
+    submissions = (
+        QuizSubmission.objects.filter(quiz_id=quiz_id, quiz__deleted_at__isnull=True)
+        .select_related('user')
+        .order_by('-score', 'submitted_at', 'pk')[:LEADERBOARD_SIZE]
+    )
+    return [
+        {
+            'rank': rank,
+            'user': submission.user_id,
+            'username': submission.user.username,
+            'score': submission.score,
+            'total_questions': submission.total_questions,
+        }
+        for rank, submission in enumerate(submissions, start=1)
+    ]
+
+
+def _initial_state(quiz_id):
+    version = get_cache().get(version_key(quiz_id))
+    last_id = QuizSubmission.objects.filter(quiz_id=quiz_id).aggregate(last=Max('pk'))['last'] or 0
+    return last_id, version, leaderboard(quiz_id)
+
+
+def _poll(cursors, versions):
+    """Fetch submissions newer than each quiz's cursor in a single query.
+
+    Also returns the current versions, and the leaderboard of every quiz
+    that got a submission or whose version changed.
+    """
+    if not cursors:
+        return [], {}, {}
+    stored = get_cache().get_many([version_key(quiz_id) for quiz_id in cursors])
+    current = {quiz_id: stored.get(version_key(quiz_id)) for quiz_id in cursors}
+    # One condition per quiz: a single shared floor would make a quiet quiz's
+    # old cursor reload the whole history of every busier one each tick.
+    newer = Q()
+    for quiz_id, cursor in cursors.items():
+        newer |= Q(quiz_id=quiz_id, pk__gt=cursor)
+    new = list(QuizSubmission.objects.filter(newer).select_related('user').order_by('pk'))
+    changed = {submission.quiz_id for submission in new}
+    changed.update(quiz_id for quiz_id, version in current.items() if version != versions.get(quiz_id))
+    return new, {quiz_id: leaderboard(quiz_id) for quiz_id in changed}, current
+
+
+class Subscriber:
+    def __init__(self, quiz_id):
+        self.quiz_id = quiz_id
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.dropped = False
+
+    def push(self, message):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A client this far behind is disconnected rather than allowed to
+            # grow memory; it can reconnect and get a fresh leaderboard.
+            self.dropped = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class QuizBroadcaster:
+    def __init__(self):
+        self._reset(None)
+
+    def _reset(self, loop):
+        self._loop = loop
+        self._subscribers = {}
+        self._cursors = {}
+        self._versions = {}
+        self._leaderboards = {}
+        self._wakeup = asyncio.Event()
+        self._poller = None
+
+    @property
+    def subscriber_count(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def subscribe(self, quiz_id):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._reset(loop)
+
+        subscriber = Subscriber(quiz_id)
+        if quiz_id not in self._subscribers:
+            last_id, version, board = await sync_to_async(_initial_state)(quiz_id)
+            if quiz_id not in self._subscribers:
+                self._cursors[quiz_id] = last_id
+                self._versions[quiz_id] = version
+                self._leaderboards[quiz_id] = board
+                self._subscribers[quiz_id] = set()
+        self._subscribers[quiz_id].add(subscriber)
+        subscriber.push(format_event('leaderboard', self._leaderboards[quiz_id]))
+
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscribers = self._subscribers.get(subscriber.quiz_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.quiz_id]
+            self._cursors.pop(subscriber.quiz_id, None)
+            self._versions.pop(subscriber.quiz_id, None)
+            self._leaderboards.pop(subscriber.quiz_id, None)
+
+    def notify(self):
+        """Wake the poller; safe to call from sync views running in threads."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while self._subscribers:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=poll_interval())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception('Live feed poll failed')
+
+    async def poll_once(self):
+        new, boards, versions = await sync_to_async(_poll)(dict(self._cursors), dict(self._versions))
+        for quiz_id, version in versions.items():
+            if quiz_id in self._subscribers:
+                self._versions[quiz_id] = version
+        for submission in new:
+            quiz_id = submission.quiz_id
+            if quiz_id not in self._subscribers:
+                continue
+            self._cursors[quiz_id] = max(self._cursors[quiz_id], submission.pk)
+            self.publish(quiz_id, format_event('submission', submission_event(submission), submission.pk))
+        for quiz_id, board in boards.items():
+            if quiz_id in self._subscribers and board != self._leaderboards.get(quiz_id):
+                self._leaderboards[quiz_id] = board
+                self.publish(quiz_id, format_event('leaderboard', board))
+
+    def publish(self, quiz_id, message):
+        for subscriber in list(self._subscribers.get(quiz_id, ())):
+            subscriber.push(message)
+
+
+broadcaster = QuizBroadcaster()
@@ -0,0 +1,150 @@
+"""Set-based bulk edits of quizzes, questions and options.
+
+Each operation applies its change to the whole selection as one ``UPDATE``
+(deletes issue one ``DELETE`` per table, leaves first, in
+``PURGE_CHUNK_SIZE`` batches) and then adjusts the counters and the search
+index once for the batch.  Like ``QuerySet.update()`` they bypass
+``save()`` and the model signals, so every side effect the single-row
+views get from those is applied here explicitly.
+"""
+from django.db import router, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import broadcast, counters, purge
+from .models import Option, Question, UserAnswer
+from .search import get_backend
+
+QUIZ_FILTERS = {
+    'category': 'category_id',
+    'created_by': 'created_by_id',
+    'is_active': 'is_active',
+    'title': 'title__icontains',
+}
+QUESTION_FILTERS = {
+    'quiz': 'quiz_id',
+    'category': 'quiz__category_id',
+    'is_active': 'is_active',
+    'text': 'text__icontains',
+}
+OPTION_FILTERS = {
+    'question': 'question_id',
+    'quiz': 'question__quiz_id',
+    'is_correct': 'is_correct',
+    'text': 'text__icontains',
+}
+
+
+def select(queryset, lookups, ids=None, filters=None):
+    """Narrow ``queryset`` to an id list or to ``filters`` named as in ``lookups``."""
+    if ids is not None:
+        return queryset.filter(pk__in=ids)
+    return queryset.filter(**{lookups[name]: value for name, value in filters.items()})
+
+
+def _chunks(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _delete_in(model, field, ids, size):
+    using = router.db_for_write(model)
+    deleted = 0
+    for chunk in _chunks(ids, size):
+        deleted += model._base_manager.filter(**{f'{field}__in': chunk})._raw_delete(using)
+    return deleted
+
+
+def set_quizzes_active(queryset, is_active):
+    with transaction.atomic():
+        updated = queryset.exclude(is_active=is_active).update(
+            is_active=is_active, updated_at=timezone.now()
+        )
+    return {'quizzes': updated}
+
+
+def recategorize_quizzes(queryset, category):
+    with transaction.atomic():
+        moving = queryset.exclude(category=category)
+        per_category = dict(
+            moving.order_by().values('category_id').annotate(moved=Count('pk'))
+            .values_list('category_id', 'moved')
+        )
+        updated = moving.update(category=category, updated_at=timezone.now())
+        counters.adjust_categories({
+            **{category_id: -moved for category_id, moved in per_category.items()},
+            category.pk: updated,
+        })
+    return {'quizzes': updated}
+
+
+def set_questions_active(queryset, is_active):
+    with transaction.atomic():
+        changing = queryset.exclude(is_active=is_active)
+        per_quiz = dict(
+            changing.order_by().values('quiz_id').annotate(changed=Count('pk'))
+            .values_list('quiz_id', 'changed')
+        )
+        updated = changing.update(is_active=is_active, updated_at=timezone.now())
+        counters.adjust_quizzes({
+            quiz_id: {'active_question_count': changed if is_active else -changed}
+            for quiz_id, changed in per_quiz.items()
+        })
+    return {'questions': updated}
+
+
+def move_questions(queryset, quiz):
+    with transaction.atomic():
+        moving = queryset.exclude(quiz=quiz)
+        per_quiz = list(
+            moving.order_by().values('quiz_id')
+            .annotate(total=Count('pk'), active=Count('pk', filter=Q(is_active=True)))
+        )
+        updated = moving.update(quiz=quiz, updated_at=timezone.now())
+        adjustments = {
+            row['quiz_id']: {'question_count': -row['total'], 'active_question_count': -row['active']}
+            for row in per_quiz
+        }
+        adjustments[quiz.pk] = {
+            'question_count': sum(row['total'] for row in per_quiz),
+            'active_question_count': sum(row['active'] for row in per_quiz),
+        }
+        counters.adjust_quizzes(adjustments)
+    return {'questions': updated}
+
+
+def delete_questions(queryset):
+    size = purge.chunk_size()
+    with transaction.atomic():
+        rows = list(queryset.values_list('pk', 'quiz_id', 'is_active'))
+        ids = [pk for pk, _, _ in rows]
+        user_answers = _delete_in(UserAnswer, 'question_id', ids, size)
+        options = _delete_in(Option, 'question_id', ids, size)
+        questions = _delete_in(Question, 'pk', ids, size)
+        for chunk in _chunks(ids, size):
+            get_backend().remove_questions(chunk)
+        adjustments = {}
+        for _, quiz_id, is_active in rows:
+            deltas = adjustments.setdefault(quiz_id, {'question_count': 0, 'active_question_count': 0})
+            deltas['question_count'] -= 1
+            deltas['active_question_count'] -= is_active
+        counters.adjust_quizzes(adjustments)
+        broadcast.mark_changed(adjustments)
+    return {'questions': questions, 'options': options, 'user_answers': user_answers}
+
+
+def set_options_correct(queryset, is_correct):
+    with transaction.atomic():
+        updated = queryset.exclude(is_correct=is_correct).update(is_correct=is_correct)
+    return {'options': updated}
+
+
+def delete_options(queryset):
+    size = purge.chunk_size()
+    with transaction.atomic():
+        rows = list(queryset.values_list('pk', 'question_id'))
+        options = _delete_in(Option, 'pk', [pk for pk, _ in rows], size)
+        question_ids = sorted({question_id for _, question_id in rows})
+        for chunk in _chunks(question_ids, size):
+            get_backend().index_questions(chunk)
+    return {'options': options}
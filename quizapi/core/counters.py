@@ -0,0 +1,125 @@
+"""Denormalized catalog counters on ``Quiz`` and ``Category``.
+
+Every write path that changes a counted relation applies the change as an
+``UPDATE ... SET col = col + n`` in the same transaction, so concurrent
+writers never overwrite each other.  ``expected_counts`` recomputes the
+true values for ``manage.py reconcile_counters``.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+
+from . import archive
+from .models import Category, Question, Quiz, QuizSubmission
+
+QUIZ_COUNTERS = ('question_count', 'active_question_count', 'submission_count', 'score_sum')
+
+
+def adjust_quiz(quiz_id, **deltas):
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if quiz_id is not None and changes:
+        Quiz.all_objects.filter(pk=quiz_id).update(**changes)
+
+
+def adjust_category(category_id, delta):
+    if category_id is not None and delta:
+        Category.all_objects.filter(pk=category_id).update(quiz_count=F('quiz_count') + delta)
+
+
+def _batched(deltas_by_pk, field):
+    return F(field) + Case(
+        *[When(pk=pk, then=Value(deltas.get(field, 0))) for pk, deltas in deltas_by_pk.items()],
+        default=Value(0),
+    )
+
+
+def adjust_quizzes(deltas_by_quiz):
+    """Apply ``{quiz_id: {field: delta}}`` to many quizzes in one UPDATE."""
+    deltas_by_quiz = {
+        quiz_id: deltas for quiz_id, deltas in deltas_by_quiz.items()
+        if quiz_id is not None and any(deltas.values())
+    }
+    fields = {field for deltas in deltas_by_quiz.values() for field, delta in deltas.items() if delta}
+    if fields:
+        Quiz.all_objects.filter(pk__in=deltas_by_quiz).update(
+            **{field: _batched(deltas_by_quiz, field) for field in fields}
+        )
+
+
+def adjust_categories(deltas_by_category):
+    """Apply ``{category_id: delta}`` to many categories in one UPDATE."""
+    adjustments = {
+        category_id: {'quiz_count': delta}
+        for category_id, delta in deltas_by_category.items() if category_id is not None and delta
+    }
+    if adjustments:
+        Category.all_objects.filter(pk__in=adjustments).update(quiz_count=_batched(adjustments, 'quiz_count'))
+
+
+def question_added(question, sign=1):
+    adjust_quiz(
+        question.quiz_id,
+        question_count=sign,
+        active_question_count=sign if question.is_active else 0,
+    )
+
+
+def question_removed(question):
+    question_added(question, sign=-1)
+
+
+def question_changed(old_quiz_id, old_is_active, question):
+    if old_quiz_id != question.quiz_id:
+        adjust_quiz(old_quiz_id, question_count=-1, active_question_count=-1 if old_is_active else 0)
+        question_added(question)
+    elif old_is_active != question.is_active:
+        adjust_quiz(question.quiz_id, active_question_count=1 if question.is_active else -1)
+
+
+def quiz_added(quiz):
+    adjust_category(quiz.category_id, 1)
+
+
+def quiz_removed(quiz):
+    adjust_category(quiz.category_id, -1)
+
+
+def quiz_moved(old_category_id, quiz):
+    if old_category_id != quiz.category_id:
+        adjust_category(old_category_id, -1)
+        adjust_category(quiz.category_id, 1)
+
+
+def submission_added(submission, sign=1):
+    adjust_quiz(submission.quiz_id, submission_count=sign, score_sum=sign * submission.score)
+
+
+def submission_removed(submission):
+    submission_added(submission, sign=-1)
+
+
+def scores_adjusted(score_deltas):
+    """Apply ``{quiz_id: score_delta}`` after a regrade."""
+    adjust_quizzes({quiz_id: {'score_sum': delta} for quiz_id, delta in score_deltas.items()})
+
+
+def expected_counts():
+    """Return ``(quiz_counts, category_counts)`` recomputed from the source tables."""
+    quiz_counts = defaultdict(lambda: dict.fromkeys(QUIZ_COUNTERS, 0))
+    for row in Question.objects.values('quiz_id').annotate(
+        total=Count('pk'), active=Count('pk', filter=Q(is_active=True))
+    ):
+        quiz_counts[row['quiz_id']]['question_count'] = row['total']
+        quiz_counts[row['quiz_id']]['active_question_count'] = row['active']
+    for row in QuizSubmission.objects.values('quiz_id').annotate(total=Count('pk'), scores=Sum('score')):
+        quiz_counts[row['quiz_id']]['submission_count'] += row['total']
+        quiz_counts[row['quiz_id']]['score_sum'] += row['scores'] or 0
+    # Archiving moves submissions out of the hot table but they still count.
+    for quiz_id, (total, scores) in archive.quiz_totals().items():
+        quiz_counts[quiz_id]['submission_count'] += total
+        quiz_counts[quiz_id]['score_sum'] += scores
+
+    category_counts = defaultdict(int)
+    for row in Quiz.objects.values('category_id').annotate(total=Count('pk')):
+        category_counts[row['category_id']] = row['total']
+    return quiz_counts, category_counts
@@ -0,0 +1,78 @@
+"""Regrading of existing submissions against the current answer key."""
+from collections import defaultdict
+
+from django.db import transaction
+
+from . import analytics, broadcast, counters, history
+from .models import Option, Quiz, QuizSubmission, UserAnswer
+
+REGRADE_CHUNK_SIZE = 500
+
+
+def correct_options_for(quiz):
+    correct = defaultdict(set)
+    for question_id, option_id in Option.objects.filter(
+        question__quiz=quiz, is_correct=True
+    ).values_list('question_id', 'id'):
+        correct[question_id].add(option_id)
+    return correct
+
+
+def regrade_quiz(quiz, chunk_size=REGRADE_CHUNK_SIZE):
+    """Re-score every submission of ``quiz`` and return how many changed.
+
+    Submissions are processed in primary-key chunks; each chunk is one
+    transaction that bulk-updates answers and scores, applies the matching
+    rollup and ``score_sum`` deltas and bumps the history version of every
+    affected user.  Only one chunk is held in memory at a time.
+
+    The regrade runs in the caller, so ``RegradeQuizView`` holds its worker
+    for as long as the quiz takes.  Chunks commit one by one and regrading
+    is idempotent, so an interrupted regrade can simply be run again.
+    """
+    correct = correct_options_for(quiz)
+    regraded = 0
+    last_pk = 0
+    while True:
+        submissions = list(
+            QuizSubmission.objects.filter(quiz=quiz, pk__gt=last_pk)
+            .order_by('pk')
+            .prefetch_related('user_answers')[:chunk_size]
+        )
+        if not submissions:
+            if regraded:
+                broadcast.mark_changed([quiz.pk])
+            return regraded
+        last_pk = submissions[-1].pk
+
+        answers_to_update = []
+        submissions_to_update = []
+        deltas = analytics.new_deltas()
+        score_delta = 0
+        for submission in submissions:
+            score = 0
+            for answer in submission.user_answers.all():
+                is_correct = answer.selected_option in correct.get(answer.question_id, ())
+                if is_correct != answer.is_correct:
+                    answer.is_correct = is_correct
+                    answers_to_update.append(answer)
+                if is_correct:
+                    score += 1
+            if score != submission.score:
+                old_score = submission.score
+                score_delta += score - old_score
+                submission.score = score
+                submissions_to_update.append(submission)
+                analytics.record_regrade(submission, old_score, deltas)
+
+        with transaction.atomic():
+            if submissions_to_update:
+                # Rollups are only written with the quiz row locked; see
+                # backfill_score_rollups.
+                list(Quiz.all_objects.select_for_update().filter(pk=quiz.pk).values_list('pk'))
+            UserAnswer.objects.bulk_update(answers_to_update, ['is_correct'])
+            QuizSubmission.objects.bulk_update(submissions_to_update, ['score'])
+            analytics.apply_deltas(deltas)
+            counters.scores_adjusted({quiz.pk: score_delta})
+            history.bump_users(submission.user_id for submission in submissions_to_update)
+        regraded += len(submissions_to_update)
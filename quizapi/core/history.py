@@ -0,0 +1,110 @@
+"""Per-user submission history cache.
+
+A user's history is cached as the rendered JSON of its summary rows, tagged
+with the (global, user) history versions it was built from.  The user
+version is bumped whenever that user's submissions change (submit,
+regrade); the global version is bumped by catalog edits that change what
+any history row shows (quiz/category rename or delete).  Versions live in
+the ``HISTORY_VERSION_CACHE_ALIAS`` cache that every worker shares;
+payloads live in ``HISTORY_CACHE_ALIAS``, which may be per process because
+a payload is only served while both versions still match the ones it was
+built from.  Rebuilding a history merges in the user's archived
+submissions (see ``core.archive``).
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from . import archive
+from .models import Quiz, QuizSubmission
+from .serializers import SubmissionSummarySerializer
+
+GLOBAL_VERSION_KEY = 'history:version:global'
+
+
+def get_cache():
+    return caches[getattr(settings, 'HISTORY_CACHE_ALIAS', 'default')]
+
+
+def get_version_cache():
+    return caches[getattr(settings, 'HISTORY_VERSION_CACHE_ALIAS', 'default')]
+
+
+def timeout():
+    return getattr(settings, 'HISTORY_CACHE_TIMEOUT', 60 * 60)
+
+
+def user_version_key(user_id):
+    return f'history:version:user:{user_id}'
+
+
+def payload_key(user_id):
+    return f'history:payload:{user_id}'
+
+
+def _bump(key):
+    # A fresh random version rather than ``incr``: shared backends such as
+    # the database cache implement ``incr`` as get-then-set, so two workers
+    # bumping at once could both write the same number and leave a payload
+    # built between the two writes looking current.  A version key that was
+    # evicted can likewise never come back equal to a stale payload's.
+    get_version_cache().set(key, uuid.uuid4().hex, timeout=None)
+
+
+def bump_user(user_id):
+    transaction.on_commit(lambda: _bump(user_version_key(user_id)))
+
+
+def bump_users(user_ids):
+    for user_id in set(user_ids):
+        bump_user(user_id)
+
+
+def bump_global():
+    transaction.on_commit(lambda: _bump(GLOBAL_VERSION_KEY))
+
+
+def build_rows(user):
+    submissions = list(
+        QuizSubmission.objects.filter(user=user, quiz__deleted_at__isnull=True)
+        .select_related('quiz__category')
+        .order_by('-submitted_at', '-pk')
+    )
+    archived = archive.user_submissions(user.pk)
+    if archived:
+        quizzes = Quiz.objects.select_related('category').in_bulk({row.quiz_id for row in archived})
+        submissions.extend(
+            QuizSubmission(
+                id=row.id, user_id=row.user_id, quiz=quizzes[row.quiz_id], score=row.score,
+                total_questions=row.total_questions, submitted_at=row.submitted_at,
+            )
+            for row in archived if row.quiz_id in quizzes
+        )
+        submissions.sort(key=lambda submission: (submission.submitted_at, submission.pk), reverse=True)
+    return SubmissionSummarySerializer(submissions, many=True).data
+
+
+def get_history(user):
+    """Return the user's history as rendered JSON bytes."""
+    version_cache = get_version_cache()
+    user_key = user_version_key(user.pk)
+    stored = version_cache.get_many([GLOBAL_VERSION_KEY, user_key])
+    versions = (stored.get(GLOBAL_VERSION_KEY), stored.get(user_key))
+    payload = get_cache().get(payload_key(user.pk))
+    if payload is not None and None not in versions and payload[0] == versions:
+        return payload[1]
+
+    if None in versions:
+        if versions[1] is None:
+            _bump(user_key)
+        if versions[0] is None:
+            _bump(GLOBAL_VERSION_KEY)
+        stored = version_cache.get_many([GLOBAL_VERSION_KEY, user_key])
+        versions = (stored.get(GLOBAL_VERSION_KEY), stored.get(user_key))
+
+    content = JSONRenderer().render(build_rows(user))
+    get_cache().set(payload_key(user.pk), (versions, content), timeout())
+    return content
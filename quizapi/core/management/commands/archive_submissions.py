@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = 'Move submissions from months older than ARCHIVE_AFTER_DAYS into compressed archive segments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, help='Override ARCHIVE_AFTER_DAYS for this run.')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the months that would be archived.')
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] is not None:
+            if options['older_than_days'] < 0:
+                raise CommandError('--older-than-days must not be negative.')
+            oldest_hot = timezone.localtime(timezone.now() - timedelta(days=options['older_than_days']))
+            cutoff = archive.month_start(oldest_hot)
+        else:
+            cutoff = archive.archive_cutoff()
+
+        months = archive.months_to_archive(cutoff)
+        if not months:
+            self.stdout.write(f'Nothing to archive before {cutoff:%Y-%m}.')
+            return
+        for start in months:
+            if options['dry_run']:
+                self.stdout.write(f'Would archive {start:%Y-%m}')
+                continue
+            segment = archive.archive_month(start)
+            if segment is None:
+                continue
+            ratio = segment.raw_bytes / segment.stored_bytes if segment.stored_bytes else 0
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {segment.submission_count} submissions / {segment.answer_count} answers '
+                f'into {segment.file_name} ({segment.stored_bytes} bytes, {ratio:.1f}x compression).'
+            ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import throttling
+
+
+class Command(BaseCommand):
+    help = 'Delete throttle buckets that have refilled completely.'
+
+    def handle(self, *args, **options):
+        deleted = throttling.prune()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} full throttle buckets.'))
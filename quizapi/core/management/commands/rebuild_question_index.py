@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the question full-text search index from Question and Option.'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt question index with {type(backend).__name__}.'))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core import counters
+from core.models import Category, Quiz
+
+
+class Command(BaseCommand):
+    help = 'Compare denormalized Quiz/Category counters with the source tables and optionally repair drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Repair the counters that drifted.')
+
+    def handle(self, *args, **options):
+        quiz_counts, category_counts = counters.expected_counts()
+        drifted = 0
+
+        for quiz in Quiz.objects.only('pk', *counters.QUIZ_COUNTERS).iterator():
+            expected = quiz_counts.get(quiz.pk, dict.fromkeys(counters.QUIZ_COUNTERS, 0))
+            deltas = {
+                field: expected[field] - getattr(quiz, field)
+                for field in counters.QUIZ_COUNTERS
+                if expected[field] != getattr(quiz, field)
+            }
+            if deltas:
+                drifted += 1
+                self.stdout.write(f'Quiz {quiz.pk}: ' + ', '.join(
+                    f'{field} {getattr(quiz, field)} -> {expected[field]}' for field in deltas
+                ))
+                if options['fix']:
+                    # Apply the difference rather than the absolute value so
+                    # increments that land during the scan are kept.
+                    with transaction.atomic():
+                        counters.adjust_quiz(quiz.pk, **deltas)
+
+        for category in Category.objects.only('pk', 'quiz_count').iterator():
+            expected = category_counts.get(category.pk, 0)
+            if expected != category.quiz_count:
+                drifted += 1
+                self.stdout.write(f'Category {category.pk}: quiz_count {category.quiz_count} -> {expected}')
+                if options['fix']:
+                    counters.adjust_category(category.pk, expected - category.quiz_count)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All counters are consistent.'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {drifted} rows.'))
+        else:
+            raise CommandError(f'{drifted} rows drifted; rerun with --fix to repair.')
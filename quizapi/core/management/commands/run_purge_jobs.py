@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from core import purge
+from core.models import PurgeJob
+
+
+class Command(BaseCommand):
+    help = 'Run pending, failed or stalled purge jobs left behind by soft deletes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Override PURGE_CHUNK_SIZE for this run.')
+        parser.add_argument(
+            '--stale-minutes', type=int, default=15,
+            help='Treat running jobs without progress for this long as abandoned.',
+        )
+
+    def handle(self, *args, **options):
+        stale_before = timezone.now() - timedelta(minutes=options['stale_minutes'])
+        jobs = PurgeJob.objects.filter(
+            Q(status__in=['pending', 'failed']) | Q(status='running', updated_at__lt=stale_before)
+        ).order_by('pk')
+
+        for job in jobs:
+            self.stdout.write(f'Running {job} ...')
+            try:
+                purge.run_job(job, options['chunk_size'])
+            except Exception as exc:
+                self.stderr.write(f'  failed: {exc}')
+                continue
+            self.stdout.write(self.style.SUCCESS(f'  deleted {job.rows_deleted} rows'))
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizScoreRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('submission_count', models.IntegerField(default=0)),
+                ('score_sum', models.IntegerField(default=0)),
+                ('percent_sum', models.IntegerField(default=0)),
+                ('pass_count', models.IntegerField(default=0)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='score_rollups', to='core.quiz')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='core_quizsc_day_829c92_idx')],
+                'unique_together': {('quiz', 'day', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Question = apps.get_model('core', 'Question')
+    Option = apps.get_model('core', 'Option')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS core_question_fts USING fts5("
+        "question_text, option_text, tokenize = 'porter unicode61')"
+    )
+    option_text = {}
+    for question_id, text in Option.objects.order_by('pk').values_list('question_id', 'text').iterator():
+        option_text.setdefault(question_id, []).append(text)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO core_question_fts (rowid, question_text, option_text) VALUES (%s, %s, %s)',
+            [
+                (question_id, text, ' '.join(option_text.get(question_id, ())))
+                for question_id, text in Question.objects.values_list('pk', 'text').iterator()
+            ],
+        )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS core_question_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_soft_delete_purgejob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:05
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_counters(apps, schema_editor):
+    Category = apps.get_model('core', 'Category')
+    Quiz = apps.get_model('core', 'Quiz')
+    Question = apps.get_model('core', 'Question')
+    QuizSubmission = apps.get_model('core', 'QuizSubmission')
+
+    for row in Question.objects.values('quiz_id').annotate(
+        total=Count('pk'), active=Count('pk', filter=Q(is_active=True))
+    ):
+        Quiz.objects.filter(pk=row['quiz_id']).update(
+            question_count=row['total'], active_question_count=row['active']
+        )
+    for row in QuizSubmission.objects.values('quiz_id').annotate(total=Count('pk'), scores=Sum('score')):
+        Quiz.objects.filter(pk=row['quiz_id']).update(
+            submission_count=row['total'], score_sum=row['scores'] or 0
+        )
+    for row in Quiz.objects.filter(deleted_at__isnull=True).values('category_id').annotate(total=Count('pk')):
+        Category.objects.filter(pk=row['category_id']).update(quiz_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_question_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='quiz_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='active_question_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='question_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='score_sum',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='submission_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
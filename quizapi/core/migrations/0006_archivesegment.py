@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_quiz_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.CharField(max_length=7)),
+                ('part', models.PositiveIntegerField(default=0)),
+                ('file_name', models.CharField(max_length=100, unique=True)),
+                ('first_submission_id', models.BigIntegerField()),
+                ('last_submission_id', models.BigIntegerField()),
+                ('submission_count', models.IntegerField(default=0)),
+                ('answer_count', models.IntegerField(default=0)),
+                ('block_count', models.IntegerField(default=0)),
+                ('raw_bytes', models.BigIntegerField(default=0)),
+                ('stored_bytes', models.BigIntegerField(default=0)),
+                ('quiz_totals', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('month', 'part')},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_category_live_name_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleBucket',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('tat', models.FloatField()),
+            ],
+        ),
+    ]
@@ -12,11 +12,30 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.role})"
 
+class SoftDeleteManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class Category(models.Model):
-    name = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    quiz_count = models.IntegerField(default=0)
+    
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+    
+    class Meta:
+        # Soft-deleted categories keep their row until purged, so the name
+        # is only unique among live ones.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name'], condition=models.Q(deleted_at__isnull=True),
+                name='unique_live_category_name',
+            ),
+        ]
     
     def __str__(self):
         return self.name
@@ -29,6 +48,20 @@ class Quiz(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    question_count = models.IntegerField(default=0)
+    active_question_count = models.IntegerField(default=0)
+    submission_count = models.IntegerField(default=0)
+    score_sum = models.BigIntegerField(default=0)
+    
+    objects = SoftDeleteManager()
+    all_objects = models.Manager()
+    
+    @property
+    def average_score(self):
+        if not self.submission_count:
+            return None
+        return round(self.score_sum / self.submission_count, 2)
     
     def __str__(self):
         return self.title
@@ -73,4 +106,83 @@ class UserAnswer(models.Model):
         unique_together = ('submission', 'question')
     
     def __str__(self):
-        return f"{self.submission.user.username} - Q{self.question.id} - Option {self.selected_option}"
\ No newline at end of file
+        return f"{self.submission.user.username} - Q{self.question.id} - Option {self.selected_option}"
+
+class QuizScoreRollup(models.Model):
+    """Per-day score histogram for a quiz, one row per (quiz, day, bucket).
+
+    Maintained incrementally by ``core.analytics`` whenever a submission is
+    graded or regraded, so analytics reads never touch ``QuizSubmission``.
+    """
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='score_rollups')
+    day = models.DateField()
+    bucket = models.PositiveSmallIntegerField()
+    submission_count = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    percent_sum = models.IntegerField(default=0)
+    pass_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('quiz', 'day', 'bucket')
+        indexes = [models.Index(fields=['day'])]
+
+    def __str__(self):
+        return f"{self.quiz_id} - {self.day} - bucket {self.bucket}: {self.submission_count}"
+
+
+class PurgeJob(models.Model):
+    """Progress of the background purge that follows a soft delete."""
+    TARGET_TYPES = (
+        ('quiz', 'Quiz'),
+        ('category', 'Category'),
+    )
+    STATUSES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    target_type = models.CharField(max_length=10, choices=TARGET_TYPES)
+    target_id = models.BigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    stage = models.CharField(max_length=50, blank=True)
+    rows_deleted = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='purge_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"purge {self.target_type} {self.target_id} ({self.status})"
+
+
+class ArchiveSegment(models.Model):
+    """Catalog entry for one cold-storage segment written by ``core.archive``."""
+    month = models.CharField(max_length=7)
+    part = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=100, unique=True)
+    first_submission_id = models.BigIntegerField()
+    last_submission_id = models.BigIntegerField()
+    submission_count = models.IntegerField(default=0)
+    answer_count = models.IntegerField(default=0)
+    block_count = models.IntegerField(default=0)
+    raw_bytes = models.BigIntegerField(default=0)
+    stored_bytes = models.BigIntegerField(default=0)
+    quiz_totals = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('month', 'part')
+
+    def __str__(self):
+        return f"{self.file_name} ({self.submission_count} submissions)"
+
+
+class ThrottleBucket(models.Model):
+    """GCRA state of one throttle bucket, see ``core.throttling``."""
+    key = models.CharField(max_length=200, primary_key=True)
+    tat = models.FloatField()
+
+    def __str__(self):
+        return f"{self.key} full at {self.tat}"
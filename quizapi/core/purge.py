@@ -0,0 +1,159 @@
+"""Soft delete plus chunked, bottom-up purge of quizzes and categories.
+
+Deleting a quiz or category only stamps ``deleted_at`` (which hides it from
+every read path) and queues a ``PurgeJob``.  The job then removes dependent
+rows leaf tables first, ``PURGE_CHUNK_SIZE`` primary keys per transaction.
+Because children are always gone before their parents, each chunk is a
+plain ``DELETE ... WHERE id IN (...)`` that bypasses Django's collector and
+per-row signals; side indexes are cleaned up explicitly per chunk instead.
+"""
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connection, router, transaction
+from django.utils import timezone
+
+from . import broadcast, counters
+from .models import (
+    Category, Option, PurgeJob, Question, Quiz, QuizScoreRollup, QuizSubmission, UserAnswer,
+)
+from .search import get_backend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def chunk_size():
+    return getattr(settings, 'PURGE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def quiz_stages(quiz_id):
+    """Dependent querysets of a quiz, ordered leaves first."""
+    return [
+        ('user_answers', UserAnswer.objects.filter(submission__quiz_id=quiz_id)),
+        ('user_answers', UserAnswer.objects.filter(question__quiz_id=quiz_id)),
+        ('options', Option.objects.filter(question__quiz_id=quiz_id)),
+        ('submissions', QuizSubmission.objects.filter(quiz_id=quiz_id)),
+        ('questions', Question.objects.filter(quiz_id=quiz_id)),
+        ('score_rollups', QuizScoreRollup.objects.filter(quiz_id=quiz_id)),
+    ]
+
+
+def soft_delete_quiz(quiz, user=None):
+    with transaction.atomic():
+        Quiz.all_objects.filter(pk=quiz.pk).update(deleted_at=timezone.now())
+        counters.quiz_removed(quiz)
+        broadcast.mark_changed([quiz.pk])
+        return enqueue('quiz', quiz.pk, user)
+
+
+def soft_delete_category(category, user=None):
+    now = timezone.now()
+    with transaction.atomic():
+        Category.all_objects.filter(pk=category.pk).update(deleted_at=now)
+        quizzes = Quiz.all_objects.filter(category=category, deleted_at__isnull=True)
+        broadcast.mark_changed(list(quizzes.values_list('pk', flat=True)))
+        quizzes.update(deleted_at=now)
+        return enqueue('category', category.pk, user)
+
+
+def soft_delete_quizzes(queryset, user=None):
+    """Soft delete every quiz in ``queryset`` with one UPDATE, one purge job each."""
+    with transaction.atomic():
+        quizzes = list(queryset.values_list('pk', 'category_id'))
+        if not quizzes:
+            return []
+        Quiz.all_objects.filter(pk__in=[pk for pk, _ in quizzes]).update(deleted_at=timezone.now())
+        removed = Counter(category_id for _, category_id in quizzes)
+        counters.adjust_categories({category_id: -count for category_id, count in removed.items()})
+        broadcast.mark_changed([pk for pk, _ in quizzes])
+        return enqueue_many('quiz', [pk for pk, _ in quizzes], user)
+
+
+def enqueue(target_type, target_id, user=None):
+    return enqueue_many(target_type, [target_id], user)[0]
+
+
+def enqueue_many(target_type, target_ids, user=None):
+    jobs = PurgeJob.objects.bulk_create(
+        PurgeJob(target_type=target_type, target_id=target_id, requested_by=user)
+        for target_id in target_ids
+    )
+    if jobs and getattr(settings, 'PURGE_IN_BACKGROUND_THREAD', True):
+        # One thread works through the whole batch so a bulk delete never
+        # runs its purges concurrently.
+        job_ids = [job.pk for job in jobs]
+        transaction.on_commit(lambda: start_background(job_ids))
+    return jobs
+
+
+def start_background(job_ids):
+    thread = threading.Thread(
+        target=_run_in_thread, args=(job_ids,), name=f'purge-{job_ids[0]}', daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _run_in_thread(job_ids):
+    try:
+        for job_id in job_ids:
+            try:
+                run_job(PurgeJob.objects.get(pk=job_id))
+            except Exception:
+                logger.exception('Purge job %s failed', job_id)
+    finally:
+        connection.close()
+
+
+def run_job(job, size=None):
+    """Run (or resume) a purge job; every stage is idempotent."""
+    close_old_connections()
+    size = size or chunk_size()
+    job.status = 'running'
+    job.error = ''
+    job.save(update_fields=['status', 'error', 'updated_at'])
+    try:
+        if job.target_type == 'category':
+            quiz_ids = Quiz.all_objects.filter(category_id=job.target_id).values_list('pk', flat=True)
+            for quiz_id in list(quiz_ids):
+                purge_quiz(job, quiz_id, size)
+            _delete_chunked(job, 'category', Category.all_objects.filter(pk=job.target_id), size)
+        else:
+            purge_quiz(job, job.target_id, size)
+    except Exception as exc:
+        job.status = 'failed'
+        job.error = str(exc)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        raise
+    job.status = 'done'
+    job.stage = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'stage', 'finished_at', 'updated_at'])
+    return job
+
+
+def purge_quiz(job, quiz_id, size):
+    for stage, queryset in quiz_stages(quiz_id):
+        on_chunk = get_backend().remove_questions if stage == 'questions' else None
+        _delete_chunked(job, stage, queryset, size, on_chunk)
+    _delete_chunked(job, 'quiz', Quiz.all_objects.filter(pk=quiz_id), size)
+
+
+def _delete_chunked(job, stage, queryset, size, on_chunk=None):
+    model = queryset.model
+    using = router.db_for_write(model)
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:size])
+        if not ids:
+            return
+        with transaction.atomic():
+            model._base_manager.filter(pk__in=ids)._raw_delete(using)
+            if on_chunk:
+                on_chunk(ids)
+            job.stage = stage
+            job.rows_deleted += len(ids)
+            job.save(update_fields=['stage', 'rows_deleted', 'updated_at'])
@@ -0,0 +1,203 @@
+"""Full-text search over the question bank.
+
+Questions are indexed together with the text of their options.  The
+backend is pluggable through ``QUESTION_SEARCH_BACKEND``; the default uses
+an SQLite FTS5 inverted index (``core_question_fts``, created by migration
+0004) and ``SimpleSearchBackend`` is a portable ``icontains`` fallback.
+The index is kept in sync by the signal handlers in ``core.signals``.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Option, Question
+
+DEFAULT_BACKEND = 'core.search.SQLiteFTS5Backend'
+FTS_TABLE = 'core_question_fts'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Candidates whose token overlap (Jaccard) with a new question reaches this
+# ratio are reported as near-duplicates.
+DUPLICATE_THRESHOLD = 0.6
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+def jaccard(left, right):
+    left, right = set(left), set(right)
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class BaseSearchBackend:
+    def index_questions(self, question_ids):
+        raise NotImplementedError
+
+    def remove_questions(self, question_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def search(self, query, quiz_id=None, category_id=None, is_active=None, limit=20, match_all=True):
+        """Return ``[(question_id, score), ...]`` best match first."""
+        raise NotImplementedError
+
+    def similar(self, text, quiz_id=None, category_id=None, exclude_ids=(), limit=5):
+        """Return ``[(question_id, similarity), ...]`` for near-duplicates of ``text``."""
+        tokens = tokenize(text)
+        if not tokens:
+            return []
+        candidates = [
+            question_id for question_id, _ in self.search(
+                ' '.join(tokens), quiz_id=quiz_id, category_id=category_id,
+                limit=limit * 4 + len(exclude_ids), match_all=False,
+            )
+            if question_id not in exclude_ids
+        ]
+        texts = dict(Question.objects.filter(pk__in=candidates).values_list('pk', 'text'))
+        scored = [
+            (question_id, round(jaccard(tokens, tokenize(texts.get(question_id))), 4))
+            for question_id in candidates
+        ]
+        scored = [row for row in scored if row[1] >= DUPLICATE_THRESHOLD]
+        scored.sort(key=lambda row: -row[1])
+        return scored[:limit]
+
+    def documents(self, question_ids=None):
+        """Yield ``(question_id, question_text, option_text)`` for indexing."""
+        questions = Question.objects.order_by('pk')
+        options = Option.objects.order_by('question_id', 'pk')
+        if question_ids is not None:
+            questions = questions.filter(pk__in=question_ids)
+            options = options.filter(question_id__in=question_ids)
+        option_text = {}
+        for question_id, text in options.values_list('question_id', 'text').iterator():
+            option_text.setdefault(question_id, []).append(text)
+        for question_id, text in questions.values_list('pk', 'text').iterator():
+            yield question_id, text, ' '.join(option_text.get(question_id, ()))
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """Inverted index in an FTS5 virtual table whose rowid is the question id."""
+
+    def index_questions(self, question_ids):
+        question_ids = list(question_ids)
+        if not question_ids:
+            return
+        with connection.cursor() as cursor:
+            self._delete(cursor, question_ids)
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, question_text, option_text) VALUES (%s, %s, %s)',
+                list(self.documents(question_ids)),
+            )
+
+    def remove_questions(self, question_ids):
+        question_ids = list(question_ids)
+        if question_ids:
+            with connection.cursor() as cursor:
+                self._delete(cursor, question_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, question_text, option_text) VALUES (%s, %s, %s)',
+                self.documents(),
+            )
+
+    def search(self, query, quiz_id=None, category_id=None, is_active=None, limit=20, match_all=True):
+        match = self.match_expression(query, match_all)
+        if not match:
+            return []
+        sql = [
+            f'SELECT f.rowid, bm25({FTS_TABLE}, 2.0, 1.0) AS rank',
+            f'FROM {FTS_TABLE} f',
+            'JOIN core_question q ON q.id = f.rowid',
+            'JOIN core_quiz z ON z.id = q.quiz_id',
+            f'WHERE {FTS_TABLE} MATCH %s AND z.deleted_at IS NULL',
+        ]
+        params = [match]
+        if quiz_id is not None:
+            sql.append('AND q.quiz_id = %s')
+            params.append(quiz_id)
+        if category_id is not None:
+            sql.append('AND z.category_id = %s')
+            params.append(category_id)
+        if is_active is not None:
+            sql.append('AND q.is_active = %s')
+            params.append(is_active)
+        sql.append('ORDER BY rank LIMIT %s')
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [(question_id, round(-rank, 4)) for question_id, rank in cursor.fetchall()]
+
+    @staticmethod
+    def match_expression(query, match_all=True):
+        # Quote every token so user input can never inject FTS5 syntax;
+        # the last token is a prefix match for search-as-you-type.
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return ''
+        terms = [f'"{token}"' for token in tokens]
+        if match_all:
+            terms[-1] += '*'
+        return (' AND ' if match_all else ' OR ').join(terms)
+
+    @staticmethod
+    def _delete(cursor, question_ids):
+        placeholders = ', '.join(['%s'] * len(question_ids))
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', question_ids)
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Database-agnostic fallback: ``icontains`` per token, ranked by hits."""
+
+    def index_questions(self, question_ids):
+        pass
+
+    def remove_questions(self, question_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, quiz_id=None, category_id=None, is_active=None, limit=20, match_all=True):
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        matches = [Q(text__icontains=token) | Q(options__text__icontains=token) for token in tokens]
+        condition = matches[0]
+        for match in matches[1:]:
+            condition = condition & match if match_all else condition | match
+        questions = Question.objects.filter(condition, quiz__deleted_at__isnull=True)
+        if quiz_id is not None:
+            questions = questions.filter(quiz_id=quiz_id)
+        if category_id is not None:
+            questions = questions.filter(quiz__category_id=category_id)
+        if is_active is not None:
+            questions = questions.filter(is_active=is_active)
+        candidates = questions.distinct().values_list('pk', flat=True)[:limit * 10]
+        ranked = [
+            (question_id, len(set(tokens) & set(tokenize(question_text + ' ' + option_text))))
+            for question_id, question_text, option_text in self.documents(list(candidates))
+        ]
+        ranked.sort(key=lambda row: (-row[1], row[0]))
+        return ranked[:limit]
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _load_backend(getattr(settings, 'QUESTION_SEARCH_BACKEND', DEFAULT_BACKEND))
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
-from .models import CustomUser, Category, Quiz, Question, QuizSubmission, UserAnswer, Option
+from django.db import transaction
+from . import analytics, counters
+from .models import CustomUser, Category, Quiz, Question, QuizSubmission, UserAnswer, Option, PurgeJob
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -50,11 +52,25 @@ class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
+        read_only_fields = ('deleted_at', 'quiz_count')
 
 class QuestionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Question
         fields = '__all__'
+    
+    @transaction.atomic
+    def create(self, validated_data):
+        question = super().create(validated_data)
+        counters.question_added(question)
+        return question
+    
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        old_quiz_id, old_is_active = instance.quiz_id, instance.is_active
+        question = super().update(instance, validated_data)
+        counters.question_changed(old_quiz_id, old_is_active, question)
+        return question
 
 class OptionSerializer(serializers.ModelSerializer):
     class Meta:
@@ -64,12 +80,32 @@ class OptionSerializer(serializers.ModelSerializer):
 class QuizSerializer(serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, read_only=True)
     created_by = UserSerializer(read_only=True)
+    average_score = serializers.FloatField(read_only=True)
     
     class Meta:
         model = Quiz
         fields = '__all__'
+        read_only_fields = (
+            'deleted_at', 'question_count', 'active_question_count', 'submission_count', 'score_sum',
+        )
+    
+    @transaction.atomic
+    def create(self, validated_data):
+        quiz = super().create(validated_data)
+        counters.quiz_added(quiz)
+        return quiz
+    
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        old_category_id = instance.category_id
+        quiz = super().update(instance, validated_data)
+        counters.quiz_moved(old_category_id, quiz)
+        return quiz
 
 class UserAnswerSerializer(serializers.ModelSerializer):
+    # Resolved for the whole list at once in QuizSubmissionSerializer.
+    question = serializers.IntegerField()
+    
     class Meta:
         model = UserAnswer
         fields = ('question', 'selected_option')
@@ -84,40 +120,48 @@ class QuizSubmissionSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('user', 'quiz', 'score', 'total_questions', 'submitted_at')
     
+    def validate_user_answers(self, user_answers):
+        question_ids = {answer['question'] for answer in user_answers}
+        questions = Question.objects.in_bulk(question_ids)
+        missing = question_ids - questions.keys()
+        if missing:
+            raise serializers.ValidationError(f'Invalid pk "{min(missing)}" - object does not exist.')
+        for answer in user_answers:
+            answer['question'] = questions[answer['question']]
+        return user_answers
+    
+    @transaction.atomic
     def create(self, validated_data):
         user_answers_data = validated_data.pop('user_answers')
         submission = QuizSubmission.objects.create(**validated_data)
         
-        score = 0
-        total_questions = 0
+        # Only count active questions
+        active_answers = [answer for answer in user_answers_data if answer['question'].is_active]
+        correct = set(Option.objects.filter(
+            question__in=[answer['question'] for answer in active_answers],
+            id__in=[answer['selected_option'] for answer in active_answers],
+            is_correct=True,
+        ).values_list('question_id', 'id'))
         
-        for answer_data in user_answers_data:
-            question = answer_data['question']
-            selected_option = answer_data['selected_option']
-            
-            # Only count active questions
-            if question.is_active:
-                total_questions += 1
-
-                try:
-                    selected_option = Option.objects.get(id=selected_option, question=question)
-                    is_correct = selected_option.is_correct
-                except Option.DoesNotExist:
-                    is_correct = False
-                
-                if is_correct:
-                    score += 1
-                
-                UserAnswer.objects.create(
-                    submission=submission,
-                    question=question,
-                    selected_option=selected_option,
-                    is_correct=is_correct
-                )
+        user_answers = [
+            UserAnswer(
+                submission=submission,
+                question=answer['question'],
+                selected_option=answer['selected_option'],
+                is_correct=(answer['question'].id, answer['selected_option']) in correct
+            )
+            for answer in active_answers
+        ]
+        UserAnswer.objects.bulk_create(user_answers)
+        score = sum(answer.is_correct for answer in user_answers)
+        total_questions = len(user_answers)
         
         submission.score = score
         submission.total_questions = total_questions
         submission.save()
+        # Quiz row first, then rollups: the order backfill_score_rollups locks in.
+        counters.submission_added(submission)
+        analytics.record_submission(submission)
         
         return submission
 
@@ -126,4 +170,74 @@ class QuizSubmissionHistorySerializer(serializers.ModelSerializer):
     
     class Meta:
         model = QuizSubmission
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class SubmissionSummarySerializer(serializers.ModelSerializer):
+    quiz_title = serializers.CharField(source='quiz.title', read_only=True)
+    category = serializers.IntegerField(source='quiz.category_id', read_only=True)
+    category_name = serializers.CharField(source='quiz.category.name', read_only=True)
+    
+    class Meta:
+        model = QuizSubmission
+        fields = ('id', 'quiz', 'quiz_title', 'category', 'category_name', 'score', 'total_questions', 'submitted_at')
+
+class PurgeJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PurgeJob
+        fields = '__all__'
+
+class BulkActionSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=10000
+    )
+    
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError('Provide either ids or filter, not both.')
+        if 'filter' in data and not data['filter']:
+            raise serializers.ValidationError({'filter': 'At least one condition is required.'})
+        return data
+
+class QuizBulkFilterSerializer(serializers.Serializer):
+    category = serializers.IntegerField(required=False)
+    created_by = serializers.IntegerField(required=False)
+    is_active = serializers.BooleanField(required=False)
+    title = serializers.CharField(required=False)
+
+class QuizBulkActionSerializer(BulkActionSerializer):
+    action = serializers.ChoiceField(choices=('activate', 'deactivate', 'recategorize', 'delete'))
+    filter = QuizBulkFilterSerializer(required=False)
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
+    
+    def validate(self, data):
+        data = super().validate(data)
+        if data['action'] == 'recategorize' and 'category' not in data:
+            raise serializers.ValidationError({'category': 'This field is required to recategorize.'})
+        return data
+
+class QuestionBulkFilterSerializer(serializers.Serializer):
+    quiz = serializers.IntegerField(required=False)
+    category = serializers.IntegerField(required=False)
+    is_active = serializers.BooleanField(required=False)
+    text = serializers.CharField(required=False)
+
+class QuestionBulkActionSerializer(BulkActionSerializer):
+    action = serializers.ChoiceField(choices=('activate', 'deactivate', 'move', 'delete'))
+    filter = QuestionBulkFilterSerializer(required=False)
+    quiz = serializers.PrimaryKeyRelatedField(queryset=Quiz.objects.all(), required=False)
+    
+    def validate(self, data):
+        data = super().validate(data)
+        if data['action'] == 'move' and 'quiz' not in data:
+            raise serializers.ValidationError({'quiz': 'This field is required to move questions.'})
+        return data
+
+class OptionBulkFilterSerializer(serializers.Serializer):
+    question = serializers.IntegerField(required=False)
+    quiz = serializers.IntegerField(required=False)
+    is_correct = serializers.BooleanField(required=False)
+    text = serializers.CharField(required=False)
+
+class OptionBulkActionSerializer(BulkActionSerializer):
+    action = serializers.ChoiceField(choices=('mark_correct', 'mark_incorrect', 'delete'))
+    filter = OptionBulkFilterSerializer(required=False)
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Option, Question
+from .search import get_backend
+
+
+@receiver(post_save, sender=Question)
+def index_question(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_backend().index_questions([instance.pk])
+
+
+@receiver(post_delete, sender=Question)
+def unindex_question(sender, instance, **kwargs):
+    get_backend().remove_questions([instance.pk])
+
+
+@receiver(post_save, sender=Option)
+@receiver(post_delete, sender=Option)
+def reindex_option_question(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_backend().index_questions([instance.question_id])
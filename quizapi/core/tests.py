@@ -1,3 +1,1467 @@
-from django.test import TestCase
+"""Tests for ``core``.
 
-# Create your tests here.
+The first part is a query-count and latency regression harness for every
+view in ``core.views``; behaviour tests for the individual modules follow
+it.
+
+Each case in ``CASES`` is one request.  The fixture is built at every size
+in ``SIZES`` (categories, quizzes per category, questions per quiz,
+submissions per quiz and the user's history all grow with it) and every
+case runs against it inside a rolled-back savepoint, with caches cleared,
+so each request measures the cold path.  The tests then check that
+
+* a case issues the same number of queries at every size;
+* it issues no more queries than recorded in ``perf_baselines.json``;
+* its best-of-``REPEAT`` time at the largest size stays within
+  ``PERF_TIME_TOLERANCE`` times the recorded time plus ``TIME_SLACK_MS``.
+
+Failures show a diff of the normalized SQL against the smaller size or the
+baseline.  After an intended change, refresh the baselines with::
+
+    UPDATE_PERF_BASELINES=1 python manage.py test core
+"""
+import difflib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections, transaction
+from django.db.utils import load_backend
+from django.test import AsyncClient, Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from django.views import View
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    analytics, archive, broadcast, bulk, counters, grading, history, purge, search, throttling, views,
+)
+from .models import (
+    ArchiveSegment, Category, CustomUser, Option, PurgeJob, Question, Quiz, QuizScoreRollup, QuizSubmission,
+    ThrottleBucket, UserAnswer,
+)
+from .search import get_backend
+from .serializers import QuestionSerializer
+
+SIZES = (3, 6, 12)
+REPEAT = 3
+BASELINE_PATH = Path(__file__).with_name('perf_baselines.json')
+TIME_TOLERANCE = float(os.environ.get('PERF_TIME_TOLERANCE', 3))
+TIME_SLACK_MS = 20
+
+Case = namedtuple(
+    'Case', 'name method path data user status stream asgi', defaults=(None, 'admin', 200, True, False)
+)
+
+CASES = [
+    Case('register', 'post', '/api/register/',
+         lambda f: {'username': 'newcomer', 'password': 'secret'}, None, 201),
+    Case('login', 'post', '/api/login/', lambda f: {'username': 'player', 'password': 'secret'}, None),
+    Case('test-auth', 'get', '/api/test-auth/', user='user'),
+
+    Case('category-list', 'get', '/api/categories/'),
+    Case('category-create', 'post', '/api/categories/', lambda f: {'name': 'New category'}, status=201),
+    Case('category-detail', 'get', lambda f: f'/api/categories/{f.category.pk}/'),
+    Case('category-update', 'put', lambda f: f'/api/categories/{f.category.pk}/',
+         lambda f: {'name': 'Renamed', 'description': 'Updated'}),
+    Case('category-patch', 'patch', lambda f: f'/api/categories/{f.category.pk}/', lambda f: {'name': 'Renamed'}),
+    Case('category-delete', 'delete', lambda f: f'/api/categories/{f.category.pk}/', status=202),
+    Case('category-analytics', 'get', lambda f: f'/api/admin/analytics/categories/{f.category.pk}/'),
+
+    Case('quiz-list', 'get', '/api/quizzes/'),
+    Case('quiz-create', 'post', '/api/quizzes/',
+         lambda f: {'title': 'New quiz', 'category': f.category.pk}, status=201),
+    Case('quiz-detail', 'get', lambda f: f'/api/quizzes/{f.quiz.pk}/'),
+    Case('quiz-update', 'put', lambda f: f'/api/quizzes/{f.quiz.pk}/',
+         lambda f: {'title': 'Renamed', 'category': f.other_category.pk}),
+    Case('quiz-patch', 'patch', lambda f: f'/api/quizzes/{f.quiz.pk}/', lambda f: {'title': 'Renamed'}),
+    Case('quiz-delete', 'delete', lambda f: f'/api/quizzes/{f.quiz.pk}/', status=202),
+    Case('quiz-toggle-active', 'patch', lambda f: f'/api/quizzes/{f.quiz.pk}/toggle-active/'),
+    Case('quiz-regrade', 'post', lambda f: f'/api/quizzes/{f.quiz.pk}/regrade/'),
+    Case('quiz-analytics', 'get', lambda f: f'/api/admin/analytics/quizzes/{f.quiz.pk}/'),
+    Case('quiz-bulk-deactivate', 'post', '/api/quizzes/bulk/',
+         lambda f: {'action': 'deactivate', 'filter': {'category': f.category.pk}}),
+    Case('quiz-bulk-recategorize', 'post', '/api/quizzes/bulk/',
+         lambda f: {'action': 'recategorize', 'ids': f.quiz_ids, 'category': f.other_category.pk}),
+    Case('quiz-bulk-delete', 'post', '/api/quizzes/bulk/',
+         lambda f: {'action': 'delete', 'filter': {'category': f.category.pk}}, status=202),
+    Case('active-quizzes', 'get', '/api/quizzes/active/', user='user'),
+
+    Case('question-list', 'get', '/api/questions/'),
+    Case('question-create', 'post', '/api/questions/',
+         lambda f: {'quiz': f.quiz.pk, 'text': 'Which planet is known as the red planet?'}, status=201),
+    Case('question-search', 'get', '/api/questions/search/?q=planet'),
+    Case('question-similar', 'get', '/api/questions/search/?q=which+planet+is+largest&similar=true'),
+    Case('question-detail', 'get', lambda f: f'/api/questions/{f.question.pk}/'),
+    Case('question-update', 'put', lambda f: f'/api/questions/{f.question.pk}/',
+         lambda f: {'quiz': f.quiz.pk, 'text': 'Reworded question', 'is_active': False}),
+    Case('question-delete', 'delete', lambda f: f'/api/questions/{f.question.pk}/', status=204),
+    Case('question-toggle-active', 'patch', lambda f: f'/api/questions/{f.question.pk}/toggle-active/'),
+    Case('question-bulk-deactivate', 'post', '/api/questions/bulk/',
+         lambda f: {'action': 'deactivate', 'filter': {'category': f.category.pk}}),
+    Case('question-bulk-move', 'post', '/api/questions/bulk/',
+         lambda f: {'action': 'move', 'filter': {'category': f.category.pk}, 'quiz': f.target_quiz.pk}),
+    Case('question-bulk-delete', 'post', '/api/questions/bulk/',
+         lambda f: {'action': 'delete', 'filter': {'quiz': f.quiz.pk}}),
+
+    Case('option-list', 'get', '/api/options/'),
+    Case('option-create', 'post', '/api/options/',
+         lambda f: {'question': f.question.pk, 'text': 'Mars'}, status=201),
+    Case('option-detail', 'get', lambda f: f'/api/options/{f.option.pk}/'),
+    Case('option-update', 'put', lambda f: f'/api/options/{f.option.pk}/',
+         lambda f: {'question': f.question.pk, 'text': 'Venus', 'is_correct': True}),
+    Case('option-delete', 'delete', lambda f: f'/api/options/{f.option.pk}/', status=204),
+    Case('option-bulk-mark-correct', 'post', '/api/options/bulk/',
+         lambda f: {'action': 'mark_correct', 'filter': {'quiz': f.quiz.pk}}),
+    Case('option-bulk-delete', 'post', '/api/options/bulk/',
+         lambda f: {'action': 'delete', 'filter': {'quiz': f.quiz.pk}}),
+
+    Case('submit-quiz', 'post', lambda f: f'/api/quizzes/{f.target_quiz.pk}/submit/',
+         lambda f: {'user_answers': [
+             {'question': question_id, 'selected_option': 1} for question_id in f.target_question_ids
+         ]}, 'user', 201),
+    Case('quiz-live-feed', 'get', lambda f: f'/api/quizzes/{f.quiz.pk}/live/?token={f.user_token}',
+         user=None, stream=False, asgi=True),
+    Case('submission-history', 'get', '/api/submissions/history/', user='user'),
+    Case('all-submissions', 'get', '/api/admin/submissions/'),
+    Case('submission-export', 'get', '/api/admin/submissions/export/'),
+    Case('purge-job-list', 'get', '/api/admin/purge-jobs/'),
+    Case('purge-job-detail', 'get', lambda f: f'/api/admin/purge-jobs/{f.job.pk}/'),
+]
+
+
+def build_fixture(size):
+    admin = CustomUser.objects.create_user('perf-admin', password='secret', role='admin')
+    user = CustomUser.objects.create_user('player', password='secret')
+    players = [user] + CustomUser.objects.bulk_create(
+        CustomUser(username=f'player-{index}') for index in range(size - 1)
+    )
+    categories = Category.objects.bulk_create(Category(name=f'Category {index}') for index in range(size))
+    quizzes = Quiz.objects.bulk_create(
+        Quiz(title=f'Quiz {index}', category=categories[0], created_by=admin) for index in range(size)
+    )
+    questions = Question.objects.bulk_create(
+        Question(quiz=quiz, text=f'Which planet is number {index} from the sun?')
+        for quiz in quizzes for index in range(size)
+    )
+    options = Option.objects.bulk_create(
+        Option(question=question, text=f'Planet {index}', is_correct=index == 0)
+        for question in questions for index in range(4)
+    )
+    # The user has taken every quiz but the last one, which the submit case uses.
+    submissions = QuizSubmission.objects.bulk_create(
+        QuizSubmission(user=player, quiz=quiz, score=1, total_questions=size)
+        for quiz in quizzes for player in players
+        if not (player == user and quiz == quizzes[-1])
+    )
+    questions_by_quiz = {}
+    for question in questions:
+        questions_by_quiz.setdefault(question.quiz_id, []).append(question)
+    UserAnswer.objects.bulk_create(
+        UserAnswer(submission=submission, question=question, selected_option=1, is_correct=True)
+        for submission in submissions for question in questions_by_quiz[submission.quiz_id]
+    )
+    # Rollup writes cost extra queries the first time a (quiz, day, bucket)
+    # row is touched, which depends on the scores rather than on the data
+    # size, so every row for today exists up front.
+    QuizScoreRollup.objects.bulk_create(
+        QuizScoreRollup(quiz=quiz, day=timezone.localdate(), bucket=bucket)
+        for quiz in quizzes for bucket in range(analytics.BUCKET_COUNT)
+    )
+    deltas = analytics.new_deltas()
+    for submission in QuizSubmission.objects.all():
+        analytics.add_to_deltas(deltas, submission.quiz_id, submission.submitted_at,
+                                submission.score, submission.total_questions)
+    analytics.apply_deltas(deltas)
+    quiz_counts, category_counts = counters.expected_counts()
+    for quiz_id, values in quiz_counts.items():
+        Quiz.all_objects.filter(pk=quiz_id).update(**values)
+    for category_id, quiz_count in category_counts.items():
+        Category.all_objects.filter(pk=category_id).update(quiz_count=quiz_count)
+    get_backend().rebuild()
+    jobs = PurgeJob.objects.bulk_create(
+        PurgeJob(target_type='quiz', target_id=index, status='done') for index in range(size)
+    )
+    return SimpleNamespace(
+        admin=admin,
+        user=user,
+        user_token=str(RefreshToken.for_user(user).access_token),
+        category=categories[0],
+        other_category=categories[1],
+        quiz=quizzes[0],
+        quiz_ids=[quiz.pk for quiz in quizzes],
+        target_quiz=quizzes[-1],
+        target_question_ids=[question.pk for question in questions_by_quiz[quizzes[-1].pk]],
+        question=questions[0],
+        option=options[1],
+        job=jobs[0],
+    )
+
+
+def resolve_value(value, fixture):
+    return value(fixture) if callable(value) else value
+
+
+def normalize_sql(sql):
+    sql = re.sub(r'"s\w+_x\d+"', '"savepoint"', sql)
+    sql = re.sub(r"'(?:[^']|'')*'", "'?'", sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    return re.sub(r'\(\?(, \?)*\)', '(...)', sql)
+
+
+def run_case(case, fixture):
+    """Run ``case`` once; return ``(status_code, seconds, normalized_sql)``."""
+    for cache in caches.all():
+        cache.clear()
+    client = APIClient()
+    if case.user:
+        client.force_authenticate(getattr(fixture, case.user))
+    data = resolve_value(case.data, fixture)
+    with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        if case.asgi:
+            response = async_to_sync(getattr(AsyncClient(), case.method))(resolve_value(case.path, fixture), data)
+        else:
+            response = getattr(client, case.method)(resolve_value(case.path, fixture), data, format='json')
+        if case.stream and response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+        transaction.set_rollback(True)
+    return response.status_code, elapsed, [normalize_sql(query['sql']) for query in captured]
+
+
+def measure():
+    """Return ``{case name: {size: {'status', 'seconds', 'sql'}}}``."""
+    results = {case.name: {} for case in CASES}
+    for size in SIZES:
+        with transaction.atomic():
+            fixture = build_fixture(size)
+            for case in CASES:
+                runs = [run_case(case, fixture) for _ in range(REPEAT if size == SIZES[-1] else 1)]
+                results[case.name][size] = {
+                    'status': runs[0][0],
+                    'seconds': min(run[1] for run in runs),
+                    'sql': runs[0][2],
+                }
+            transaction.set_rollback(True)
+    return results
+
+
+def sql_diff(before, after, before_label, after_label):
+    return '\n'.join(difflib.unified_diff(before, after, before_label, after_label, lineterm=''))
+
+
+@override_settings(
+    THROTTLE_ENABLED=False,
+    PURGE_IN_BACKGROUND_THREAD=False,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ViewPerformanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.results = measure()
+        cls.baselines = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        if os.environ.get('UPDATE_PERF_BASELINES'):
+            largest = SIZES[-1]
+            cls.baselines = {
+                name: {
+                    'queries': len(by_size[largest]['sql']),
+                    'ms': round(by_size[largest]['seconds'] * 1000, 2),
+                    'sql': by_size[largest]['sql'],
+                }
+                for name, by_size in cls.results.items()
+            }
+            BASELINE_PATH.write_text(json.dumps(cls.baselines, indent=2, sort_keys=True) + '\n')
+
+    def test_every_view_is_covered(self):
+        view_classes = {
+            value for value in vars(views).values()
+            if isinstance(value, type) and issubclass(value, View) and value.__module__ == views.__name__
+        }
+        fixture = SimpleNamespace(**dict.fromkeys(
+            ('category', 'other_category', 'quiz', 'target_quiz', 'question', 'option', 'job'),
+            SimpleNamespace(pk=1),
+        ), user_token='')
+        covered = {
+            resolve(resolve_value(case.path, fixture).split('?')[0]).func.view_class for case in CASES
+        }
+        self.assertEqual(
+            sorted(cls.__name__ for cls in view_classes - covered), [],
+            'Every view needs a case in CASES.'
+        )
+
+    def test_status_codes(self):
+        for case in CASES:
+            with self.subTest(case=case.name):
+                for size, result in self.results[case.name].items():
+                    self.assertEqual(result['status'], case.status, f'size {size}')
+
+    def test_query_count_does_not_grow_with_data(self):
+        smallest = SIZES[0]
+        for case in CASES:
+            with self.subTest(case=case.name):
+                by_size = self.results[case.name]
+                for size in SIZES[1:]:
+                    before, after = by_size[smallest]['sql'], by_size[size]['sql']
+                    if len(after) != len(before):
+                        self.fail(
+                            f'{len(before)} queries at size {smallest} but {len(after)} at size {size}:\n'
+                            + sql_diff(before, after, f'size {smallest}', f'size {size}')
+                        )
+
+    def test_query_count_within_baseline(self):
+        largest = SIZES[-1]
+        for case in CASES:
+            with self.subTest(case=case.name):
+                baseline = self.baselines.get(case.name)
+                self.assertIsNotNone(baseline, 'No baseline; run with UPDATE_PERF_BASELINES=1.')
+                captured = self.results[case.name][largest]['sql']
+                if len(captured) > baseline['queries']:
+                    self.fail(
+                        f'{len(captured)} queries, budget is {baseline["queries"]}:\n'
+                        + sql_diff(baseline['sql'], captured, 'baseline', 'current')
+                    )
+
+    def test_time_within_baseline(self):
+        largest = SIZES[-1]
+        for case in CASES:
+            with self.subTest(case=case.name):
+                baseline = self.baselines.get(case.name)
+                self.assertIsNotNone(baseline, 'No baseline; run with UPDATE_PERF_BASELINES=1.')
+                elapsed_ms = self.results[case.name][largest]['seconds'] * 1000
+                budget_ms = baseline['ms'] * TIME_TOLERANCE + TIME_SLACK_MS
+                if elapsed_ms > budget_ms:
+                    self.fail(
+                        f'{elapsed_ms:.1f} ms, budget is {budget_ms:.1f} ms '
+                        f'(baseline {baseline["ms"]} ms); queries:\n'
+                        + sql_diff(baseline['sql'], self.results[case.name][largest]['sql'],
+                                   'baseline', 'current')
+                    )
+
+
+def make_quiz(title='Quiz', questions=3, category=None, admin=None):
+    """A quiz whose questions each have a correct and an incorrect option.
+
+    Rows are created directly, with the counters kept in step.
+    """
+    admin = admin or CustomUser.objects.get_or_create(username='admin', defaults={'role': 'admin'})[0]
+    category = category or Category.objects.get_or_create(name='General')[0]
+    quiz = Quiz.objects.create(title=title, category=category, created_by=admin)
+    counters.quiz_added(quiz)
+    for index in range(questions):
+        question = Question.objects.create(quiz=quiz, text=f'{title} question {index}')
+        counters.question_added(question)
+        Option.objects.create(question=question, text='right', is_correct=True)
+        Option.objects.create(question=question, text='wrong')
+    return quiz
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.quiz = make_quiz()
+        self.user = CustomUser.objects.create_user('taker')
+
+    def submission(self, score, total=10):
+        return QuizSubmission.objects.create(user=self.user, quiz=self.quiz, score=score, total_questions=total)
+
+    def rollup(self, bucket):
+        return QuizScoreRollup.objects.get(quiz=self.quiz, bucket=bucket)
+
+    def test_buckets(self):
+        self.assertEqual(analytics.score_percent(2, 3), 67)
+        self.assertEqual(analytics.score_percent(0, 0), 0)
+        self.assertEqual(
+            [analytics.bucket_for(percent) for percent in (0, 9, 10, 59, 60, 99, 100)],
+            [0, 0, 1, 5, 6, 9, 9],
+        )
+        self.assertEqual(analytics.bucket_label(0), '0-9')
+        self.assertEqual(analytics.bucket_label(9), '90-100')
+
+    @override_settings(QUIZ_PASS_PERCENTAGE=60)
+    def test_record_submission(self):
+        analytics.record_submission(self.submission(6))
+        analytics.record_submission(self.submission(6))
+        analytics.record_submission(self.submission(5))
+        passed = self.rollup(6)
+        self.assertEqual(
+            (passed.day, passed.submission_count, passed.score_sum, passed.percent_sum, passed.pass_count),
+            (timezone.localdate(), 2, 12, 120, 2),
+        )
+        failed = self.rollup(5)
+        self.assertEqual((failed.submission_count, failed.pass_count), (1, 0))
+
+    @override_settings(QUIZ_PASS_PERCENTAGE=60)
+    def test_regrade_moves_one_unit_between_buckets(self):
+        submission = self.submission(5)
+        analytics.record_submission(submission)
+        submission.score = 8
+        analytics.record_regrade(submission, old_score=5)
+        old, new = self.rollup(5), self.rollup(8)
+        self.assertEqual((old.submission_count, old.score_sum, old.percent_sum, old.pass_count), (0, 0, 0, 0))
+        self.assertEqual((new.submission_count, new.score_sum, new.percent_sum, new.pass_count), (1, 8, 80, 1))
+        self.assertEqual(analytics.summarize(QuizScoreRollup.objects.all())['submissions'], 1)
+
+    @override_settings(QUIZ_PASS_PERCENTAGE=60)
+    def test_summarize(self):
+        day = timezone.localdate()
+        QuizScoreRollup.objects.create(quiz=self.quiz, day=day, bucket=2, submission_count=1,
+                                       score_sum=2, percent_sum=25, pass_count=0)
+        QuizScoreRollup.objects.create(quiz=self.quiz, day=day, bucket=7, submission_count=3,
+                                       score_sum=21, percent_sum=215, pass_count=3)
+        summary = analytics.summarize(QuizScoreRollup.objects.all())
+        self.assertEqual(summary['submissions'], 4)
+        self.assertEqual(summary['mean_percent'], 60.0)
+        self.assertEqual(summary['pass_rate'], 0.75)
+        # The 2nd of 4 submissions is the 1st of 3 in the 70-79 bucket: 70 + 1/3 * 10.
+        self.assertEqual(summary['median_percent'], 73.33)
+        self.assertEqual(
+            [row['count'] for row in summary['histogram']], [0, 0, 1, 0, 0, 0, 0, 3, 0, 0]
+        )
+        self.assertEqual(summary['by_day'], [
+            {'day': day, 'submissions': 4, 'mean_percent': 60.0, 'pass_rate': 0.75},
+        ])
+
+    def test_median_in_top_bucket_reaches_100(self):
+        QuizScoreRollup.objects.create(quiz=self.quiz, day=timezone.localdate(), bucket=9,
+                                       submission_count=2, percent_sum=200)
+        # The top bucket is 11 points wide (90-100).
+        self.assertEqual(analytics.summarize(QuizScoreRollup.objects.all())['median_percent'], 95.5)
+        self.assertIsNone(analytics.summarize(QuizScoreRollup.objects.none())['median_percent'])
+
+    def test_regrade_quiz_in_chunks(self):
+        wrong = Option.objects.filter(question__quiz=self.quiz, is_correct=False).first()
+        for _ in range(5):
+            submission = self.submission(0, total=3)
+            analytics.record_submission(submission)
+            counters.submission_added(submission)
+            UserAnswer.objects.create(submission=submission, question=wrong.question,
+                                      selected_option=wrong.pk, is_correct=False)
+        Option.objects.filter(pk=wrong.pk).update(is_correct=True)
+
+        self.assertEqual(grading.regrade_quiz(self.quiz, chunk_size=2), 5)
+        self.assertEqual(set(QuizSubmission.objects.values_list('score', flat=True)), {1})
+        self.assertEqual(Quiz.objects.get(pk=self.quiz.pk).score_sum, 5)
+        self.assertEqual(analytics.summarize(QuizScoreRollup.objects.all())['histogram'][3]['count'], 5)
+        self.assertEqual(grading.regrade_quiz(self.quiz, chunk_size=2), 0)
+
+    def test_backfill_is_idempotent(self):
+        live = self.submission(9)
+        analytics.record_submission(live)
+        QuizSubmission.objects.bulk_create([
+            QuizSubmission(user=self.user, quiz=self.quiz, score=score, total_questions=10)
+            for score in (1, 9, 4)
+        ])
+        QuizScoreRollup.objects.create(quiz=self.quiz, day=timezone.localdate(), bucket=0, submission_count=7)
+
+        for _ in range(2):
+            call_command('backfill_score_rollups', stdout=StringIO())
+            rows = {
+                row.bucket: row.submission_count
+                for row in QuizScoreRollup.objects.filter(quiz=self.quiz)
+            }
+            self.assertEqual(rows, {1: 1, 4: 1, 9: 2})
+
+
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def indexed_questions(question_ids):
+    """Ids among ``question_ids`` that still have a row in the search index.
+
+    Searches join the question table, so stale index rows never show up in
+    results; this reads the index itself.
+    """
+    question_ids = list(question_ids)
+    placeholders = ', '.join(['%s'] * len(question_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT rowid FROM {search.FTS_TABLE} WHERE rowid IN ({placeholders})', question_ids)
+        return {row[0] for row in cursor.fetchall()}
+
+
+@override_settings(PURGE_IN_BACKGROUND_THREAD=False)
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user('admin', role='admin')
+        self.client = api_client(self.admin)
+
+    def test_category_name_is_reusable_after_delete(self):
+        first = self.client.post('/api/categories/', {'name': 'Science'}, format='json')
+        self.assertEqual(first.status_code, 201)
+        duplicate = self.client.post('/api/categories/', {'name': 'Science'}, format='json')
+        self.assertEqual(duplicate.status_code, 400)
+        self.assertIn('name', duplicate.data)
+
+        self.assertEqual(self.client.delete(f"/api/categories/{first.data['id']}/").status_code, 202)
+        second = self.client.post('/api/categories/', {'name': 'Science'}, format='json')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(Category.all_objects.filter(name='Science').count(), 2)
+
+    def admin_site_client(self):
+        superuser = CustomUser.objects.create_superuser('root', password='secret')
+        client = Client()
+        client.force_login(superuser)
+        return client
+
+    def test_admin_delete_soft_deletes_quiz(self):
+        quiz = make_quiz()
+        client = self.admin_site_client()
+        response = client.post(f'/admin/core/quiz/{quiz.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        quiz = Quiz.all_objects.get(pk=quiz.pk)
+        self.assertIsNotNone(quiz.deleted_at)
+        self.assertEqual(quiz.category.quiz_count, 0)
+        self.assertTrue(PurgeJob.objects.filter(target_type='quiz', target_id=quiz.pk).exists())
+
+    def test_admin_bulk_delete_soft_deletes_categories(self):
+        categories = [Category.objects.create(name=name) for name in ('A', 'B')]
+        make_quiz(category=categories[0])
+        client = self.admin_site_client()
+        response = client.post('/admin/core/category/', {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': [category.pk for category in categories],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Category.objects.exists())
+        self.assertEqual(Category.all_objects.count(), 2)
+        self.assertFalse(Quiz.objects.exists())
+        self.assertEqual(PurgeJob.objects.filter(target_type='category').count(), 2)
+
+
+    def queries_to_delete(self, client, url, data):
+        # The admin log caches content types after the first delete.
+        ContentType.objects.clear_cache()
+        # The delete view confirms on GET, the delete_selected action on POST.
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as confirm:
+            page = client.post(url, data) if data else client.get(url)
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as delete:
+            response = client.post(url, {**data, 'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        return page, len(confirm), len(delete)
+
+    def quiz_with_submissions(self, title, submissions, category=None):
+        quiz = make_quiz(title, questions=3, category=category)
+        for number in range(submissions):
+            player = CustomUser.objects.create_user(f'{title}-player-{number}')
+            submission = QuizSubmission.objects.create(user=player, quiz=quiz, score=0, total_questions=3)
+            counters.submission_added(submission)
+            UserAnswer.objects.bulk_create(
+                UserAnswer(submission=submission, question=question, selected_option=1)
+                for question in quiz.questions.all()
+            )
+        return quiz
+
+    def test_admin_delete_does_not_walk_the_cascade(self):
+        client = self.admin_site_client()
+        small, large = self.quiz_with_submissions('Small', 1), self.quiz_with_submissions('Large', 30)
+        queries = []
+        for quiz in (small, large):
+            page, confirm, delete = self.queries_to_delete(client, f'/admin/core/quiz/{quiz.pk}/delete/', {})
+            queries.append((confirm, delete))
+        self.assertEqual(queries[0], queries[1])
+        self.assertLessEqual(max(queries[1]), 15)
+        self.assertContains(page, 'Quiz submissions: 30')
+        self.assertContains(page, 'Questions: 3')
+
+    def test_admin_bulk_delete_does_not_walk_the_cascade(self):
+        client = self.admin_site_client()
+        queries = []
+        for size in (1, 20):
+            category = Category.objects.create(name=f'Size {size}')
+            for number in range(2):
+                self.quiz_with_submissions(f'Quiz {size}-{number}', size, category)
+            page, confirm, delete = self.queries_to_delete(client, '/admin/core/category/', {
+                'action': 'delete_selected', '_selected_action': [category.pk],
+            })
+            queries.append((confirm, delete))
+        self.assertEqual(queries[0], queries[1])
+        self.assertLessEqual(max(queries[1]), 20)
+        self.assertContains(page, 'Quizs: 2')
+        self.assertContains(page, 'Quiz submissions: 40')
+        self.assertEqual(PurgeJob.objects.filter(target_type='category').count(), 2)
+
+@override_settings(PURGE_IN_BACKGROUND_THREAD=False)
+class PurgeJobTests(TestCase):
+    def populate(self, quiz, submissions=2):
+        for number in range(submissions):
+            submission = QuizSubmission.objects.create(
+                user=CustomUser.objects.create_user(f'{quiz.title}-{number}'), quiz=quiz,
+                score=1, total_questions=quiz.question_count,
+            )
+            counters.submission_added(submission)
+            analytics.record_submission(submission)
+            UserAnswer.objects.bulk_create(
+                UserAnswer(submission=submission, question=question, selected_option=1)
+                for question in quiz.questions.all()
+            )
+
+    def rows(self, quiz_ids):
+        return {
+            'user_answers': UserAnswer.objects.filter(submission__quiz__in=quiz_ids).count(),
+            'options': Option.objects.filter(question__quiz__in=quiz_ids).count(),
+            'submissions': QuizSubmission.objects.filter(quiz__in=quiz_ids).count(),
+            'questions': Question.objects.filter(quiz__in=quiz_ids).count(),
+            'score_rollups': QuizScoreRollup.objects.filter(quiz__in=quiz_ids).count(),
+            'quiz': Quiz.all_objects.filter(pk__in=quiz_ids).count(),
+        }
+
+    def run_recording_progress(self, job, size):
+        progress = []
+        save = PurgeJob.save
+
+        def recording_save(job, *args, **kwargs):
+            progress.append((job.stage, job.rows_deleted))
+            return save(job, *args, **kwargs)
+
+        with mock.patch.object(PurgeJob, 'save', recording_save):
+            purge.run_job(job, size=size)
+        return progress
+
+    def test_quiz_purge_removes_every_dependent_row_in_chunks(self):
+        quiz, kept = make_quiz('Doomed'), make_quiz('Kept')
+        self.populate(quiz)
+        self.populate(kept)
+        question_ids = set(quiz.questions.values_list('pk', flat=True))
+        expected = self.rows([quiz.pk])
+        self.assertEqual(expected, {
+            'user_answers': 6, 'options': 6, 'submissions': 2, 'questions': 3, 'score_rollups': 1, 'quiz': 1,
+        })
+        kept_rows = self.rows([kept.pk])
+
+        job = purge.soft_delete_quiz(quiz)
+        progress = self.run_recording_progress(job, size=2)
+
+        self.assertEqual(self.rows([quiz.pk]), dict.fromkeys(expected, 0))
+        self.assertEqual(self.rows([kept.pk]), kept_rows)
+        self.assertEqual(indexed_questions(question_ids), set())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.stage), ('done', ''))
+        self.assertEqual(job.rows_deleted, sum(expected.values()))
+        self.assertIsNotNone(job.finished_at)
+
+        # One save per chunk, each at most ``size`` rows further, stages leaves first.
+        chunks = [(stage, rows) for stage, rows in progress if stage]
+        steps = [after - before for (_, before), (_, after) in zip([('', 0)] + chunks, chunks)]
+        self.assertTrue(all(0 < step <= 2 for step in steps), steps)
+        stages = list(dict.fromkeys(stage for stage, _ in chunks))
+        self.assertEqual(stages, ['user_answers', 'options', 'submissions', 'questions', 'score_rollups', 'quiz'])
+        self.assertEqual(chunks[-1][1], job.rows_deleted)
+
+    def test_category_purge_removes_its_quizzes(self):
+        category = Category.objects.create(name='Doomed')
+        quizzes = [make_quiz(f'Quiz {number}', category=category) for number in range(2)]
+        for quiz in quizzes:
+            self.populate(quiz, submissions=1)
+        quiz_ids = [quiz.pk for quiz in quizzes]
+
+        job = purge.soft_delete_category(category)
+        purge.run_job(job, size=2)
+
+        self.assertEqual(set(self.rows(quiz_ids).values()), {0})
+        self.assertFalse(Category.all_objects.filter(pk=category.pk).exists())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+
+    def test_run_purge_jobs_resumes_failed_and_stale_jobs(self):
+        failed, stale, busy = (make_quiz(f'Quiz {number}') for number in range(3))
+        self.populate(failed)
+        failed_job = purge.soft_delete_quiz(failed)
+        with mock.patch.object(purge, 'get_backend', side_effect=DatabaseError('index locked')):
+            with self.assertRaises(DatabaseError):
+                purge.run_job(failed_job, size=2)
+        failed_job.refresh_from_db()
+        self.assertEqual((failed_job.status, failed_job.stage, failed_job.error),
+                         ('failed', 'submissions', 'index locked'))
+        self.assertGreater(Question.objects.filter(quiz=failed).count(), 0)
+
+        stale_job, busy_job = (purge.soft_delete_quiz(quiz) for quiz in (stale, busy))
+        PurgeJob.objects.filter(pk__in=[stale_job.pk, busy_job.pk]).update(status='running')
+        PurgeJob.objects.filter(pk=stale_job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        out = StringIO()
+        call_command('run_purge_jobs', '--chunk-size', '2', stdout=out)
+
+        statuses = dict(PurgeJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {failed_job.pk: 'done', stale_job.pk: 'done', busy_job.pk: 'running'})
+        self.assertEqual(set(self.rows([failed.pk, stale.pk]).values()), {0})
+        self.assertTrue(Quiz.all_objects.filter(pk=busy.pk).exists())
+        self.assertEqual(out.getvalue().count('deleted'), 2)
+
+class QuestionSearchTests(TestCase):
+    def setUp(self):
+        self.client = api_client(CustomUser.objects.create_user('searcher', role='admin'))
+        self.astronomy = make_quiz('Astronomy', questions=0, category=Category.objects.create(name='Science'))
+        self.history = make_quiz('History', questions=0, category=Category.objects.create(name='History'))
+        self.in_text = self.question(self.astronomy, 'Which planet has rings', 'Saturn', 'Venus')
+        self.in_option = self.question(self.astronomy, 'Which one has rings', 'The planet Saturn', 'Venus')
+        self.red = self.question(self.history, 'Which planet was named for the god of war', 'Mars', 'Venus',
+                                 is_active=False)
+        self.roads = self.question(self.history, 'Which empire built the first roads', 'Rome', 'Persia')
+
+    def question(self, quiz, text, right, wrong, is_active=True):
+        question = Question.objects.create(quiz=quiz, text=text, is_active=is_active)
+        Option.objects.create(question=question, text=right, is_correct=True)
+        Option.objects.create(question=question, text=wrong)
+        return question
+
+    def search(self, **params):
+        response = self.client.get('/api/questions/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [result['id'] for result in response.data]
+
+    def test_question_text_outranks_option_text(self):
+        ranked = self.search(q='planet')
+        self.assertEqual(sorted(ranked), sorted([self.in_text.pk, self.in_option.pk, self.red.pk]))
+        self.assertEqual(ranked[-1], self.in_option.pk)
+
+    def test_last_token_is_a_prefix(self):
+        self.assertEqual(set(self.search(q='which plan')), {self.in_text.pk, self.in_option.pk, self.red.pk})
+        self.assertEqual(self.search(q='plan which'), [])
+        self.assertEqual(self.search(q='emp'), [self.roads.pk])
+
+    def test_filters(self):
+        self.assertEqual(set(self.search(q='planet', quiz=self.astronomy.pk)), {self.in_text.pk, self.in_option.pk})
+        self.assertEqual(self.search(q='planet', category=self.history.category_id), [self.red.pk])
+        self.assertEqual(self.search(q='planet', is_active='false'), [self.red.pk])
+        self.assertNotIn(self.red.pk, self.search(q='planet', is_active='true'))
+        response = self.client.get('/api/questions/search/', {'q': 'planet', 'quiz': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/questions/search/', {'q': ' '}).status_code, 400)
+
+    def test_soft_deleted_quizzes_are_excluded(self):
+        purge.soft_delete_quiz(self.history)
+        self.assertEqual(set(self.search(q='planet')), {self.in_text.pk, self.in_option.pk})
+        self.assertEqual(self.search(q='roads'), [])
+
+    def test_index_follows_question_and_option_changes(self):
+        self.in_text.text = 'Which moon has geysers'
+        self.in_text.save()
+        self.assertEqual(self.search(q='geysers'), [self.in_text.pk])
+        self.assertNotIn(self.in_text.pk, self.search(q='planet'))
+
+        option = Option.objects.create(question=self.roads, text='Carthage')
+        self.assertEqual(self.search(q='carthage'), [self.roads.pk])
+        option.delete()
+        self.assertEqual(self.search(q='carthage'), [])
+
+        question_id = self.roads.pk
+        self.roads.delete()
+        self.assertEqual(indexed_questions([question_id]), set())
+
+    def test_fts_syntax_is_quoted(self):
+        for query in ('planet OR roads', 'planet NOT rings', 'NEAR(planet rings)', 'text:planet', '"planet', '*'):
+            response = self.client.get('/api/questions/search/', {'q': query})
+            self.assertEqual(response.status_code, 200, query)
+        # Operators are plain words, so they have to match too.
+        self.assertEqual(self.search(q='planet OR roads'), [])
+        self.assertEqual(self.search(q='"planet rings'), [self.in_text.pk, self.in_option.pk])
+
+    def test_similar_questions(self):
+        ranked = get_backend().similar('Which planet has the rings')
+        self.assertEqual([question_id for question_id, _ in ranked], [self.in_text.pk])
+        self.assertGreaterEqual(ranked[0][1], search.DUPLICATE_THRESHOLD)
+
+        response = self.client.get('/api/questions/search/', {'q': 'which one has rings', 'similar': 'true'})
+        self.assertEqual([result['id'] for result in response.data], [self.in_option.pk, self.in_text.pk])
+        self.assertTrue(all(result['similarity'] >= search.DUPLICATE_THRESHOLD for result in response.data))
+
+    def test_create_reports_near_duplicates(self):
+        response = self.client.post('/api/questions/', {
+            'quiz': self.astronomy.pk, 'text': 'Which planet has big rings',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        similar = response.data['similar_questions']
+        self.assertEqual([result['id'] for result in similar], [self.in_text.pk])
+        self.assertGreaterEqual(similar[0]['similarity'], search.DUPLICATE_THRESHOLD)
+
+        response = self.client.post('/api/questions/', {
+            'quiz': self.astronomy.pk, 'text': 'How far away is the sun',
+        }, format='json')
+        self.assertEqual(response.data['similar_questions'], [])
+
+    @override_settings(QUESTION_SEARCH_BACKEND='core.search.SimpleSearchBackend')
+    def test_simple_backend_returns_the_same_shape(self):
+        ranked = get_backend().search('planet')
+        self.assertIsInstance(get_backend(), search.SimpleSearchBackend)
+        self.assertEqual({question_id for question_id, _ in ranked}, {self.in_text.pk, self.in_option.pk, self.red.pk})
+        self.assertTrue(all(isinstance(score, (int, float)) for _, score in ranked))
+        self.assertEqual(self.search(q='planet', category=self.history.category_id), [self.red.pk])
+        self.assertEqual(self.search(q='roads', is_active='true'), [self.roads.pk])
+        fields = set(self.client.get('/api/questions/search/', {'q': 'planet'}).data[0])
+        self.assertIn('score', fields)
+        self.assertLessEqual(set(QuestionSerializer(self.red).data), fields)
+
+class CounterAssertions:
+    def assertCountersConsistent(self):
+        quiz_counts, category_counts = counters.expected_counts()
+        for quiz in Quiz.all_objects.all():
+            stored = {field: getattr(quiz, field) for field in counters.QUIZ_COUNTERS}
+            expected = dict(quiz_counts.get(quiz.pk, dict.fromkeys(counters.QUIZ_COUNTERS, 0)))
+            self.assertEqual(stored, expected, f'counters of quiz {quiz.pk} ({quiz.title})')
+        for category in Category.objects.all():
+            self.assertEqual(category.quiz_count, category_counts.get(category.pk, 0),
+                             f'quiz_count of category {category.pk} ({category.name})')
+
+
+class AdminCounterTests(CounterAssertions, TestCase):
+    def setUp(self):
+        self.superuser = CustomUser.objects.create_superuser('root', password='secret')
+        self.client = Client()
+        self.client.force_login(self.superuser)
+        self.first = make_quiz('First', questions=2)
+        self.second = make_quiz('Second', questions=1, category=Category.objects.create(name='Other'))
+
+    def change(self, model, obj, **data):
+        response = self.client.post(f'/admin/core/{model}/{obj.pk}/change/', data)
+        self.assertEqual(response.status_code, 302)
+
+    def test_quiz_add_and_move(self):
+        response = self.client.post('/admin/core/quiz/add/', {
+            'title': 'Third', 'description': '', 'category': self.first.category_id,
+            'created_by': self.superuser.pk, 'is_active': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.change('quiz', self.first, title='First', description='', category=self.second.category_id,
+                    created_by=self.superuser.pk, is_active='on')
+        self.assertEqual(Category.objects.get(pk=self.second.category_id).quiz_count, 2)
+        self.assertCountersConsistent()
+
+    def test_counters_are_read_only(self):
+        self.change('quiz', self.first, title='First', description='', category=self.first.category_id,
+                    created_by=self.superuser.pk, is_active='on', question_count=99)
+        self.assertEqual(Quiz.objects.get(pk=self.first.pk).question_count, 2)
+
+    def test_question_add_change_delete(self):
+        response = self.client.post('/admin/core/question/add/', {
+            'quiz': self.first.pk, 'text': 'Added', 'is_active': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        question = self.first.questions.first()
+        self.change('question', question, quiz=self.second.pk, text=question.text)
+        self.assertCountersConsistent()
+
+        response = self.client.post(f'/admin/core/question/{question.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertCountersConsistent()
+
+        response = self.client.post('/admin/core/question/', {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': list(self.first.questions.values_list('pk', flat=True)),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Quiz.objects.get(pk=self.first.pk).question_count, 0)
+        self.assertCountersConsistent()
+
+    def test_submission_add_change_delete(self):
+        data = {'user': self.superuser.pk, 'quiz': self.first.pk, 'score': 2, 'total_questions': 2}
+        response = self.client.post('/admin/core/quizsubmission/add/', data)
+        self.assertEqual(response.status_code, 302)
+        submission = QuizSubmission.objects.get()
+        self.change('quizsubmission', submission, **{**data, 'quiz': self.second.pk, 'score': 1})
+        self.assertCountersConsistent()
+        self.assertEqual(analytics.summarize(QuizScoreRollup.objects.filter(quiz=self.second))['submissions'], 1)
+        self.assertEqual(analytics.summarize(QuizScoreRollup.objects.filter(quiz=self.first))['submissions'], 0)
+
+        response = self.client.post(f'/admin/core/quizsubmission/{submission.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertCountersConsistent()
+        self.assertEqual(analytics.summarize(QuizScoreRollup.objects.all())['submissions'], 0)
+
+
+@override_settings(THROTTLE_ENABLED=False, PURGE_IN_BACKGROUND_THREAD=False)
+class CounterConsistencyTests(CounterAssertions, TestCase):
+    """Every API write path leaves the stored counters equal to a recount."""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user('admin', role='admin')
+        self.player = CustomUser.objects.create_user('player')
+        self.client = api_client(self.admin)
+
+    def request(self, method, url, data=None, status=200, client=None):
+        response = getattr(client or self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        self.assertCountersConsistent()
+        return response.data
+
+    def create(self, url, **data):
+        return self.request('post', url, data, 201)['id']
+
+    def test_write_paths(self):
+        science = self.create('/api/categories/', name='Science')
+        history_category = self.create('/api/categories/', name='History')
+        first = self.create('/api/quizzes/', title='First', category=science)
+        second = self.create('/api/quizzes/', title='Second', category=science)
+        third = self.create('/api/quizzes/', title='Third', category=history_category)
+        q1, q2 = (self.create('/api/questions/', quiz=first, text=f'First {n}') for n in (1, 2))
+        q3, q4 = (self.create('/api/questions/', quiz=second, text=f'Second {n}') for n in (1, 2))
+        q5 = self.create('/api/questions/', quiz=third, text='Third 1')
+        # Submissions carry option ids in the 1-4 range.
+        Option.objects.create(pk=1, question_id=q1, text='right', is_correct=True)
+        Option.objects.create(pk=2, question_id=q1, text='wrong')
+        Option.objects.create(pk=3, question_id=q2, text='right', is_correct=True)
+        Option.objects.create(pk=4, question_id=q2, text='wrong')
+
+        self.request('put', f'/api/quizzes/{second}/', {'title': 'Second', 'category': history_category})
+        self.request('patch', f'/api/quizzes/{first}/', {'title': 'First quiz'})
+        self.request('put', f'/api/questions/{q4}/', {'quiz': third, 'text': 'Moved', 'is_active': False})
+        self.request('patch', f'/api/questions/{q3}/toggle-active/')
+        self.request('patch', f'/api/quizzes/{third}/toggle-active/')
+        self.request('patch', f'/api/quizzes/{third}/toggle-active/')
+
+        self.request('post', f'/api/quizzes/{first}/submit/', {'user_answers': [
+            {'question': q1, 'selected_option': 1}, {'question': q2, 'selected_option': 4},
+        ]}, 201, client=api_client(self.player))
+        self.assertEqual(Quiz.objects.get(pk=first).score_sum, 1)
+        self.request('put', '/api/options/4/', {'question': q2, 'text': 'also right', 'is_correct': True})
+        self.assertEqual(self.request('post', f'/api/quizzes/{first}/regrade/')['regraded'], 1)
+        self.assertEqual(Quiz.objects.get(pk=first).score_sum, 2)
+
+        self.request('post', '/api/questions/bulk/', {'action': 'move', 'ids': [q3], 'quiz': first})
+        self.request('post', '/api/questions/bulk/', {'action': 'deactivate', 'filter': {'quiz': third}})
+        self.request('post', '/api/questions/bulk/', {'action': 'activate', 'ids': [q3, q4, q5]})
+        self.request('post', '/api/quizzes/bulk/', {
+            'action': 'recategorize', 'filter': {'category': history_category}, 'category': science,
+        })
+        self.request('post', '/api/quizzes/bulk/', {'action': 'deactivate', 'ids': [second]})
+        self.request('post', '/api/options/bulk/', {'action': 'delete', 'filter': {'question': q1}})
+        self.request('post', '/api/questions/bulk/', {'action': 'delete', 'ids': [q4, q5]})
+        self.request('delete', f'/api/questions/{q3}/', status=204)
+        self.request('delete', f'/api/quizzes/{third}/', status=202)
+        self.request('post', '/api/quizzes/bulk/', {'action': 'delete', 'ids': [second]}, 202)
+        self.request('delete', f'/api/categories/{science}/', status=202)
+        self.request('delete', f'/api/categories/{history_category}/', status=202)
+
+
+class BulkEditTests(CounterAssertions, TestCase):
+    def setUp(self):
+        self.client = api_client(CustomUser.objects.create_user('editor', role='admin'))
+        self.science = Category.objects.create(name='Science')
+        self.first = make_quiz('First', questions=3)
+        self.second = make_quiz('Second', questions=2)
+        self.third = make_quiz('Third', questions=1, category=self.science)
+
+    def bulk(self, kind, data, status=200):
+        response = self.client.post(f'/api/{kind}/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response.data
+
+    def test_selection_must_be_ids_or_a_filter(self):
+        errors = self.bulk('questions', {'action': 'deactivate', 'filter': {}}, 400)
+        self.assertEqual(errors['filter'], ['At least one condition is required.'])
+        errors = self.bulk('questions', {
+            'action': 'deactivate', 'ids': [1], 'filter': {'quiz': self.first.pk},
+        }, 400)
+        self.assertEqual(errors['non_field_errors'], ['Provide either ids or filter, not both.'])
+        errors = self.bulk('quizzes', {'action': 'deactivate'}, 400)
+        self.assertEqual(errors['non_field_errors'], ['Provide either ids or filter, not both.'])
+        self.assertEqual(Question.objects.filter(is_active=False).count(), 0)
+
+    def test_activation_counts_only_changed_rows(self):
+        data = {'action': 'deactivate', 'filter': {'quiz': self.first.pk}}
+        self.assertEqual(self.bulk('questions', data), {'action': 'deactivate', 'questions': 3})
+        self.assertEqual(self.bulk('questions', data)['questions'], 0)
+        self.assertEqual(Quiz.objects.get(pk=self.first.pk).active_question_count, 0)
+        self.assertCountersConsistent()
+
+        ids = list(Question.objects.values_list('pk', flat=True))
+        self.assertEqual(self.bulk('questions', {'action': 'activate', 'ids': ids})['questions'], 3)
+        self.assertEqual(self.bulk('quizzes', {'action': 'deactivate', 'filter': {'title': 'third'}})['quizzes'], 1)
+        self.assertCountersConsistent()
+
+    def test_move_questions(self):
+        moving = list(Question.objects.exclude(quiz=self.third).values_list('pk', flat=True)[:4])
+        Question.objects.filter(pk=moving[0]).update(is_active=False)
+        counters.adjust_quizzes({self.first.pk: {'active_question_count': -1}})
+        result = self.bulk('questions', {'action': 'move', 'ids': moving, 'quiz': self.third.pk})
+        self.assertEqual(result, {'action': 'move', 'questions': 4})
+        third = Quiz.objects.get(pk=self.third.pk)
+        self.assertEqual((third.question_count, third.active_question_count), (5, 4))
+        self.assertCountersConsistent()
+
+    def test_recategorize_quizzes(self):
+        result = self.bulk('quizzes', {
+            'action': 'recategorize', 'ids': [self.first.pk, self.second.pk, self.third.pk],
+            'category': self.science.pk,
+        })
+        # Quizzes already in the target category are not counted.
+        self.assertEqual(result, {'action': 'recategorize', 'quizzes': 2})
+        self.assertEqual(Category.objects.get(pk=self.science.pk).quiz_count, 3)
+        self.assertEqual(Category.objects.get(name='General').quiz_count, 0)
+        self.assertCountersConsistent()
+
+    def test_delete_questions_removes_them_from_search(self):
+        deleted = set(self.first.questions.values_list('pk', flat=True))
+        self.assertEqual(indexed_questions(deleted), deleted)
+        question = self.first.questions.first()
+        submission = QuizSubmission.objects.create(
+            user=CustomUser.objects.create_user('player'), quiz=self.first, score=0, total_questions=3,
+        )
+        counters.submission_added(submission)
+        UserAnswer.objects.create(submission=submission, question=question, selected_option=1)
+        self.assertTrue(get_backend().search('First'))
+
+        result = self.bulk('questions', {'action': 'delete', 'filter': {'quiz': self.first.pk}})
+        self.assertEqual(result, {'action': 'delete', 'questions': 3, 'options': 6, 'user_answers': 1})
+        self.assertEqual(indexed_questions(deleted), set())
+        self.assertEqual(len(get_backend().search('Second')), 2)
+        self.assertEqual(Quiz.objects.get(pk=self.first.pk).question_count, 0)
+        self.assertCountersConsistent()
+
+    def test_delete_options_reindexes_questions(self):
+        question = self.third.questions.get()
+        self.assertEqual(get_backend().search('wrong', quiz_id=self.third.pk), [(question.pk, mock.ANY)])
+        result = self.bulk('options', {'action': 'delete', 'filter': {'quiz': self.third.pk, 'is_correct': False}})
+        self.assertEqual(result, {'action': 'delete', 'options': 1})
+        self.assertEqual(get_backend().search('wrong', quiz_id=self.third.pk), [])
+        self.assertEqual(question.options.count(), 1)
+
+
+class HistoryCacheTests(TestCase):
+    def setUp(self):
+        self.quiz = make_quiz()
+        self.user = CustomUser.objects.create_user('taker')
+        history.get_cache().clear()
+        history.get_version_cache().clear()
+
+    def test_bump_from_another_worker_invalidates(self):
+        self.assertEqual(json.loads(history.get_history(self.user)), [])
+        QuizSubmission.objects.create(user=self.user, quiz=self.quiz, score=1, total_questions=3)
+        # A separate connection to the same alias stands in for the worker
+        # that handled the submit.
+        other_worker = caches.create_connection(settings.HISTORY_VERSION_CACHE_ALIAS)
+        other_worker.set(history.user_version_key(self.user.pk), 'bumped elsewhere', timeout=None)
+        self.assertEqual(len(json.loads(history.get_history(self.user))), 1)
+
+    def test_every_bump_is_a_new_version(self):
+        key = history.user_version_key(self.user.pk)
+        versions = set()
+        for _ in range(3):
+            history._bump(key)
+            versions.add(history.get_version_cache().get(key))
+        self.assertEqual(len(versions), 3)
+
+    def test_payloads_stay_out_of_the_shared_cache(self):
+        history.get_history(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(json.loads(history.get_history(self.user)), [])
+        # A hit reads both versions in one query and the payload from memory.
+        self.assertEqual(len(queries), 1)
+        self.assertIsNone(history.get_version_cache().get(history.payload_key(self.user.pk)))
+        self.assertIsNotNone(history.get_cache().get(history.payload_key(self.user.pk)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            history.bump_user(self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            history.get_history(self.user)
+        self.assertFalse([query for query in queries if 'INSERT' in query['sql'] or 'UPDATE' in query['sql']])
+
+
+@override_settings(PURGE_IN_BACKGROUND_THREAD=False)
+class LiveFeedTests(TestCase):
+    def setUp(self):
+        self.quiz = make_quiz(questions=1)
+        self.player = CustomUser.objects.create_user('player')
+        self.submission = QuizSubmission.objects.create(user=self.player, quiz=self.quiz, score=0, total_questions=1)
+        self.wrong = Option.objects.get(question__quiz=self.quiz, is_correct=False)
+        UserAnswer.objects.create(
+            submission=self.submission, question=self.wrong.question,
+            selected_option=self.wrong.pk, is_correct=False,
+        )
+        broadcast.get_cache().clear()
+        last_id, self.version, self.board = broadcast._initial_state(self.quiz.pk)
+        self.cursors = {self.quiz.pk: last_id}
+
+    def poll(self):
+        new, boards, versions = broadcast._poll(self.cursors, {self.quiz.pk: self.version})
+        self.assertEqual(new, [])
+        return boards
+
+    def test_unchanged_quiz_is_not_recomputed(self):
+        self.assertEqual(self.poll(), {})
+
+    def test_regrade_recomputes_leaderboard(self):
+        Option.objects.filter(pk=self.wrong.pk).update(is_correct=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(grading.regrade_quiz(self.quiz), 1)
+        boards = self.poll()
+        self.assertEqual(boards[self.quiz.pk][0]['score'], 1)
+
+    def test_soft_delete_empties_leaderboard(self):
+        self.assertEqual(len(self.board), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            purge.soft_delete_quiz(self.quiz)
+        self.assertEqual(self.poll(), {self.quiz.pk: []})
+
+    def test_bulk_question_delete_marks_quiz(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.delete_questions(Question.objects.filter(quiz=self.quiz))
+        self.assertIn(self.quiz.pk, self.poll())
+
+    def test_poll_reads_only_new_rows_of_each_quiz(self):
+        QuizSubmission.objects.bulk_create(
+            QuizSubmission(user=self.player, quiz=self.quiz, score=0, total_questions=1) for _ in range(20)
+        )
+        empty = make_quiz('Empty', questions=0)
+        cursors = {quiz_id: broadcast._initial_state(quiz_id)[0] for quiz_id in (self.quiz.pk, empty.pk)}
+        self.assertEqual(cursors[empty.pk], 0)
+        latest = QuizSubmission.objects.create(user=self.player, quiz=empty, score=0, total_questions=0)
+
+        loaded = []
+        from_db = QuizSubmission.from_db.__func__
+
+        def counting_from_db(cls, *args):
+            loaded.append(from_db(cls, *args))
+            return loaded[-1]
+
+        with mock.patch.object(QuizSubmission, 'from_db', classmethod(counting_from_db)):
+            new, boards, _ = broadcast._poll(cursors, {})
+        self.assertEqual(new, [latest])
+        # The new row and the leaderboard it changes, not the busy quiz's history.
+        self.assertEqual(len(loaded), 2)
+        self.assertEqual(set(boards), {empty.pk})
+
+    def test_stream_is_only_served_over_asgi(self):
+        path = f'/api/quizzes/{self.quiz.pk}/live/?token={RefreshToken.for_user(self.player).access_token}'
+        response = Client().get(path)
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+        response = async_to_sync(AsyncClient().get)(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+@override_settings(THROTTLE_ENABLED=False, ARCHIVE_BLOCK_ROWS=2)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.enterContext(self.settings(ARCHIVE_ROOT=Path(root.name)))
+        archive.index_cache.clear()
+        self.quiz = make_quiz(questions=2)
+        self.questions = list(self.quiz.questions.order_by('pk'))
+        self.users = {name: CustomUser.objects.create_user(name) for name in ('ann', 'bob', 'cy')}
+        # Ids interleave users so the clustering has something to do.
+        self.submissions = [
+            self.old_submission(name, day)
+            for day, name in enumerate(('ann', 'bob', 'ann', 'cy', 'bob', 'ann'), start=3)
+        ]
+        self.january = archive.month_start(datetime(2024, 1, 15))
+
+    def old_submission(self, name, day, quiz=None):
+        submission = QuizSubmission.objects.create(
+            user=self.users[name], quiz=quiz or self.quiz, score=day % 3, total_questions=2,
+        )
+        for question in self.questions:
+            UserAnswer.objects.create(submission=submission, question=question,
+                                      selected_option=day, is_correct=question == self.questions[0])
+        submitted_at = timezone.make_aware(datetime(2024, 1, day, 12, 30, 15, 123456))
+        QuizSubmission.objects.filter(pk=submission.pk).update(submitted_at=submitted_at)
+        submission.submitted_at = submitted_at
+        return submission
+
+    def test_struct_round_trip(self):
+        submitted_at = timezone.make_aware(datetime(2024, 2, 29, 23, 59, 59, 999999))
+        answers = [(2 ** 40, -7, True), (5, 3, False)]
+        data = (
+            archive.pack_submission((2 ** 63, 9, 2 ** 33, -1, 2 ** 31 - 1, submitted_at), answers)
+            + archive.pack_submission((11, 10, 1, 0, 0, submitted_at), [])
+        )
+        self.assertEqual(len(data), 2 * archive.SUBMISSION.size + 2 * archive.ANSWER.size)
+        first, second = archive.unpack_block(data)
+        self.assertEqual(first, archive.ArchivedSubmission(
+            2 ** 63, 9, 2 ** 33, -1, 2 ** 31 - 1, submitted_at,
+            (archive.ArchivedAnswer(2 ** 40, -7, True), archive.ArchivedAnswer(5, 3, False)),
+        ))
+        self.assertEqual(second.answers, ())
+        self.assertEqual([row.id for row in archive.unpack_block(data, user_id=10)], [11])
+
+    def test_segment_is_clustered_by_user(self):
+        segment = archive.archive_month(self.january)
+        self.assertEqual((segment.file_name, segment.submission_count, segment.answer_count,
+                          segment.block_count), ('2024-01.0', 6, 12, 3))
+        self.assertEqual(segment.quiz_totals, {str(self.quiz.pk): [6, sum(s.score for s in self.submissions)]})
+        rows = list(archive.iter_segment(segment))
+        expected = sorted(self.submissions, key=lambda s: (s.user_id, s.pk))
+        self.assertEqual([row.id for row in rows], [s.pk for s in expected])
+        self.assertEqual(rows[0].submitted_at, expected[0].submitted_at)
+        self.assertEqual(len(rows[0].answers), 2)
+
+        users = archive.load_index(segment)['users']
+        self.assertEqual({name: users[str(user.pk)]['blocks'] for name, user in self.users.items()},
+                         {'ann': [0, 1], 'bob': [1, 2], 'cy': [2]})
+        self.assertEqual(users[str(self.users['cy'].pk)]['quizzes'], [self.quiz.pk])
+        self.assertFalse(QuizSubmission.objects.exists())
+        self.assertFalse(UserAnswer.objects.exists())
+
+    def test_history_and_duplicate_submit_after_archiving(self):
+        archive.archive_month(self.january)
+        other = make_quiz('Other', questions=1)
+        ann = self.users['ann']
+        hot = QuizSubmission.objects.create(user=ann, quiz=other, score=1, total_questions=1)
+
+        rows = history.build_rows(ann)
+        archived_ids = [s.pk for s in reversed(self.submissions) if s.user_id == ann.pk]
+        self.assertEqual([row['id'] for row in rows], [hot.pk, *archived_ids])
+        self.assertEqual(rows[1]['quiz_title'], self.quiz.title)
+
+        response = api_client(ann).post(f'/api/quizzes/{self.quiz.pk}/submit/', {'user_answers': [
+            {'question': self.questions[0].pk, 'selected_option': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'You have already submitted this quiz.'})
+
+    def test_export_date_filters(self):
+        archive.archive_month(self.january)
+        hot = self.old_submission('cy', 20)
+        client = api_client(CustomUser.objects.create_user('exporter', role='admin'))
+
+        def export(query):
+            response = client.get(f'/api/admin/submissions/export/{query}')
+            self.assertEqual(response.status_code, 200)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+            return [(int(line.split(',')[0]), line.split(',')[-1]) for line in lines[1:]]
+
+        by_day = {submission.submitted_at.day: submission.pk for submission in self.submissions}
+        # ``until`` includes the whole day; archived rows come first.
+        self.assertEqual(sorted(export('?since=2024-01-04&until=2024-01-06')),
+                         sorted((by_day[day], '1') for day in (4, 5, 6)))
+        self.assertEqual(export('?since=2024-01-08'), [(by_day[8], '1'), (hot.pk, '0')])
+        self.assertEqual(len(export('')), 7)
+        self.assertEqual(export('?until=2023-12-31'), [])
+        self.assertEqual(client.get('/api/admin/submissions/export/?since=January').status_code, 400)
+
+    def archive_february(self):
+        archive.archive_month(self.january)
+        other = make_quiz('Other', questions=1)
+        february = [self.old_submission('bob', day, quiz=other) for day in (3, 4)]
+        QuizSubmission.objects.filter(pk__in=[s.pk for s in february]).update(
+            submitted_at=timezone.make_aware(datetime(2024, 2, 10)),
+        )
+        archive.archive_month(archive.next_month(self.january))
+        return other, february
+
+    def test_filtered_reads_skip_other_segments(self):
+        other, february = self.archive_february()
+
+        def read(**filters):
+            with mock.patch.object(archive, 'iter_segment', wraps=archive.iter_segment) as iter_segment:
+                ids = sorted(row.id for row in archive.iter_archived(**filters))
+            return ids, [call.args[0].month for call in iter_segment.call_args_list]
+
+        february_ids = sorted(s.pk for s in february)
+        self.assertEqual(read(since=timezone.make_aware(datetime(2024, 2, 1))), (february_ids, ['2024-02']))
+        self.assertEqual(read(until=timezone.make_aware(datetime(2024, 2, 1)))[1], ['2024-01'])
+        self.assertEqual(read(quiz_id=other.pk), (february_ids, ['2024-02']))
+        self.assertEqual(read(quiz_id=self.quiz.pk, since=timezone.make_aware(datetime(2024, 2, 1))), ([], []))
+        # Rows are still filtered inside the segments that are read.
+        self.assertEqual(read(since=timezone.make_aware(datetime(2024, 1, 8)))[0],
+                         sorted([self.submissions[-1].pk] + february_ids))
+
+    def test_index_cache_is_capped_by_size(self):
+        other, _ = self.archive_february()
+        january, february = ArchiveSegment.objects.order_by('month')
+        sizes = [len(zlib.decompress((archive.archive_root() / f'{segment.file_name}.qidx').read_bytes()))
+                 for segment in (january, february)]
+
+        with self.settings(ARCHIVE_INDEX_CACHE_BYTES=max(sizes)):
+            archive.index_cache.clear()
+            for segment in (january, february, january):
+                archive.load_index(segment)
+            self.assertEqual(list(archive.index_cache.entries), [str(archive.archive_root() / '2024-01.0.qidx')])
+            self.assertEqual(archive.index_cache.size, sizes[0])
+
+        with self.settings(ARCHIVE_INDEX_CACHE_BYTES=min(sizes) - 1):
+            archive.index_cache.clear()
+            self.assertIn(str(self.users['ann'].pk), archive.load_index(january)['users'])
+            self.assertEqual((archive.index_cache.entries, archive.index_cache.size), ({}, 0))
+
+        # Duplicate checks only open the indexes of segments holding the quiz.
+        with mock.patch.object(archive, 'load_index', wraps=archive.load_index) as load_index:
+            self.assertTrue(archive.has_submission(self.users['bob'].pk, other.pk))
+            self.assertFalse(archive.has_submission(self.users['ann'].pk, other.pk))
+        self.assertEqual({call.args[0].month for call in load_index.call_args_list}, {'2024-02'})
+
+    def test_crash_between_files_and_segment_row(self):
+        with mock.patch.object(ArchiveSegment.objects, 'create', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                archive.archive_month(self.january)
+        root = archive.archive_root()
+        self.assertEqual(sorted(path.name for path in root.iterdir()), ['2024-01.0.qarc', '2024-01.0.qidx'])
+        self.assertEqual(QuizSubmission.objects.count(), 6)
+
+        # The retry reuses the part name and replaces the orphaned files.
+        late = self.old_submission('cy', 28)
+        segment = archive.archive_month(self.january)
+        self.assertEqual((segment.file_name, segment.submission_count), ('2024-01.0', 7))
+        self.assertEqual(sorted(path.name for path in root.iterdir()), ['2024-01.0.qarc', '2024-01.0.qidx'])
+        self.assertEqual(sorted(row.id for row in archive.iter_archived()),
+                         sorted([s.pk for s in self.submissions] + [late.pk]))
+        self.assertEqual([row.id for row in archive.user_submissions(self.users['cy'].pk)],
+                         [self.submissions[3].pk, late.pk])
+        self.assertFalse(QuizSubmission.objects.exists())
+
+
+def connect_sqlite(alias, path):
+    """A connection outside ``DATABASES``, installed under ``alias``."""
+    connections[alias] = load_backend('django.db.backends.sqlite3').DatabaseWrapper(
+        connections.configure_settings({
+            DEFAULT_DB_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(path), 'OPTIONS': {'timeout': 30}},
+        })[DEFAULT_DB_ALIAS],
+        alias,
+    )
+    return connections[alias]
+
+
+def take_tokens(alias, path, buckets, attempts, start, results):
+    """Child process body for ``ThrottleConcurrencyTests``."""
+    connect_sqlite(alias, path)
+    start.wait()
+    results.put(sum(throttling.take(buckets, time.time()) == 0 for _ in range(attempts)))
+
+
+@override_settings(
+    THROTTLE_ENABLED=True, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    THROTTLE_POLICIES={
+        'register': {'rate': '1/h', 'burst': 2, 'key': 'ip'},
+        'submit_quiz': {'rate': '1/h', 'burst': 1, 'key': 'user_quiz'},
+        'quiz_submissions': {'rate': '1/h', 'burst': 3, 'key': 'quiz'},
+    },
+)
+class ThrottleTests(TestCase):
+    def test_burst_then_refill(self):
+        bucket = [('b', 10.0, 3)]
+        self.assertEqual([throttling.take(bucket, 1000.0) for _ in range(4)], [0, 0, 0, 10.0])
+        # One token comes back per interval.
+        self.assertEqual(throttling.take(bucket, 1005.0), 5.0)
+        self.assertEqual([throttling.take(bucket, 1010.0) for _ in range(2)], [0, 10.0])
+        # An idle bucket refills to the burst and no further.
+        self.assertEqual([throttling.take(bucket, 2000.0) for _ in range(4)], [0, 0, 0, 10.0])
+
+    def test_prune_keeps_partial_buckets(self):
+        throttling.take([('idle', 10.0, 3)], 1000.0)
+        throttling.take([('busy', 10.0, 3)], 1000.0)
+        throttling.take([('busy', 10.0, 3)], 1005.0)
+        self.assertEqual(throttling.prune(now=1015.0), 1)
+        self.assertEqual(list(ThrottleBucket.objects.values_list('key', flat=True)), ['busy'])
+        out = StringIO()
+        call_command('prune_throttle_buckets', stdout=out)
+        self.assertIn('Deleted 1 full throttle buckets.', out.getvalue())
+
+    def test_retry_after(self):
+        client = APIClient()
+        for n in range(2):
+            client.post('/api/register/', {'username': f'new{n}', 'password': 'secret'})
+        response = client.post('/api/register/', {'username': 'late', 'password': 'secret'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), (3599, 3600))
+
+    def test_user_and_quiz_keys_are_independent(self):
+        quizzes = [make_quiz(f'Quiz {n}', questions=0) for n in range(2)]
+        players = [api_client(CustomUser.objects.create_user(f'player{n}')) for n in range(2)]
+
+        def submit(player, quiz):
+            return player.post(f'/api/quizzes/{quiz.pk}/submit/', {'user_answers': []}, format='json').status_code
+
+        with mock.patch.object(views.SubmitQuizView, 'throttle_policies', ('submit_quiz',)):
+            self.assertEqual([submit(players[0], quizzes[0]) for _ in range(2)], [201, 429])
+            # Another user on the same quiz and the same user on another quiz.
+            self.assertEqual(submit(players[1], quizzes[0]), 201)
+            self.assertEqual(submit(players[0], quizzes[1]), 201)
+
+        with mock.patch.object(views.SubmitQuizView, 'throttle_policies', ('quiz_submissions',)):
+            # One bucket for the whole quiz, whoever submits.
+            others = [api_client(CustomUser.objects.create_user(f'other{n}')) for n in range(4)]
+            self.assertEqual([submit(other, quizzes[0]) for other in others], [201, 201, 201, 429])
+            self.assertEqual(submit(others[3], quizzes[1]), 201)
+
+    def test_rejected_request_takes_no_tokens(self):
+        quiz = make_quiz(questions=0)
+        url = f'/api/quizzes/{quiz.pk}/submit/'
+        with mock.patch.object(views.SubmitQuizView, 'throttle_policies', ('submit_quiz', 'quiz_submissions')):
+            abuser = api_client(CustomUser.objects.create_user('abuser'))
+            statuses = [abuser.post(url, {'user_answers': []}, format='json').status_code for _ in range(10)]
+            self.assertEqual(statuses, [201] + [429] * 9)
+            # The abuser's rejected attempts left the shared quiz bucket alone.
+            players = [CustomUser.objects.create_user(f'player{n}') for n in range(3)]
+            statuses = [
+                api_client(player).post(url, {'user_answers': []}, format='json').status_code
+                for player in players
+            ]
+        self.assertEqual(statuses, [201, 201, 429])
+        # Rejected by the quiz bucket, the last player keeps their own token.
+        self.assertFalse(ThrottleBucket.objects.filter(key=f'submit_quiz:u{players[2].pk}:q{quiz.pk}').exists())
+
+    def test_forwarded_for_header_is_not_trusted(self):
+        client = APIClient()
+        statuses = [
+            client.post('/api/register/', {'username': f'new{n}', 'password': 'secret'},
+                        HTTP_X_FORWARDED_FOR=f'203.0.113.{n}', REMOTE_ADDR='198.51.100.7').status_code
+            for n in range(3)
+        ]
+        self.assertEqual(statuses, [201, 201, 429])
+        self.assertEqual(set(ThrottleBucket.objects.values_list('key', flat=True)), {'register:198.51.100.7'})
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_forwarded_for_behind_proxy(self):
+        response = APIClient().post('/api/register/', {'username': 'new', 'password': 'secret'},
+                                    HTTP_X_FORWARDED_FOR='203.0.113.9, 10.0.0.1', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ThrottleBucket.objects.get().key, 'register:10.0.0.1')
+
+
+class ThrottleConcurrencyTests(SimpleTestCase):
+    """Worker processes sharing one database never admit more than the burst."""
+
+    alias = 'throttle_concurrency'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'throttle.sqlite3'
+        connection = connect_sqlite(self.alias, self.path)
+        self.addCleanup(connections.__delitem__, self.alias)
+        self.addCleanup(connection.close)
+        with connection.schema_editor() as editor:
+            editor.create_model(ThrottleBucket)
+        # Children open their own connection instead of sharing this one.
+        connection.close()
+
+    @override_settings(THROTTLE_DATABASE=alias)
+    def test_processes_share_the_burst(self):
+        context = multiprocessing.get_context('fork')
+        start, results = context.Event(), context.Queue()
+        buckets = [('user:u1', 3600.0, 5), ('quiz:q1', 3600.0, 12)]
+        workers = [
+            context.Process(target=take_tokens, args=(self.alias, self.path, buckets, 10, start, results)) for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        start.set()
+        admitted = sum(results.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join(timeout=60)
+            self.assertEqual(worker.exitcode, 0)
+
+        self.assertEqual(admitted, 5)
+        tats = dict(ThrottleBucket.objects.using(self.alias).values_list('key', 'tat'))
+        # Both buckets advanced by exactly the admitted requests.
+        self.assertEqual(tats.keys(), {'user:u1', 'quiz:q1'})
+        self.assertAlmostEqual(tats['user:u1'] - tats['quiz:q1'], 0, delta=5)
@@ -0,0 +1,164 @@
+"""Token-bucket throttling shared by every worker process.
+
+Views list the policies that apply to them::
+
+    throttle_classes = [TokenBucketThrottle]
+    throttle_policies = ('submit', 'submit_quiz')
+
+and ``THROTTLE_POLICIES`` in settings defines each one::
+
+    'submit_quiz': {'rate': '3/min', 'burst': 3, 'key': 'user_quiz'}
+
+``rate`` is the refill rate, ``burst`` the bucket size and ``key`` what a
+bucket belongs to (see ``KEY_FUNCTIONS``).  Each bucket is a
+``ThrottleBucket`` row in the ``THROTTLE_DATABASE`` database holding a
+single "theoretical arrival time" (GCRA).  A token is taken with one
+conditional ``UPDATE`` that only matches while the bucket has room, so
+concurrent workers can never admit more than the burst.
+
+A request takes a token from every policy or from none: the buckets are
+updated narrowest key first in one transaction, which is rolled back as
+soon as one of them is empty, so a rejected request does not drain the
+shared buckets (such as the per-quiz one) that other clients draw from.
+
+Throttles run before the view body, so a rejected login never reaches
+password hashing and a rejected submission never reaches grading; DRF
+turns the rejection into a 429 with ``Retry-After``.  The ``ip`` key is
+DRF's ``get_ident``, which only trusts ``X-Forwarded-For`` for the
+``NUM_PROXIES`` proxies in front of the app.  Full buckets are equivalent
+to missing ones; ``manage.py prune_throttle_buckets`` deletes them.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest
+from rest_framework.throttling import BaseThrottle
+
+from .models import ThrottleBucket
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'10/min'`` -> seconds between tokens."""
+    count, period = rate.split('/')
+    return PERIODS[period[0]] / int(count)
+
+
+def database():
+    return getattr(settings, 'THROTTLE_DATABASE', 'default')
+
+
+def ident_key(throttle, request, view):
+    return throttle.get_ident(request)
+
+
+def user_key(throttle, request, view):
+    if request.user and request.user.is_authenticated:
+        return f'u{request.user.pk}'
+    return throttle.get_ident(request)
+
+
+def username_key(throttle, request, view):
+    username = request.data.get('username') if hasattr(request.data, 'get') else None
+    if not username:
+        return throttle.get_ident(request)
+    # Hashed so arbitrary client input always fits the key column.
+    return 'n' + hashlib.sha1(str(username).lower().encode()).hexdigest()
+
+
+def quiz_key(throttle, request, view):
+    return f'q{view.kwargs.get("quiz_id", view.kwargs.get("pk"))}'
+
+
+def user_quiz_key(throttle, request, view):
+    return f'{user_key(throttle, request, view)}:{quiz_key(throttle, request, view)}'
+
+
+# Narrowest first: the order buckets are checked and locked in.
+KEY_FUNCTIONS = {
+    'user_quiz': user_quiz_key,
+    'username': username_key,
+    'user': user_key,
+    'ip': ident_key,
+    'quiz': quiz_key,
+}
+KEY_ORDER = list(KEY_FUNCTIONS)
+
+
+def take(buckets, now):
+    """Take a token from each ``(key, interval, burst)`` bucket, or from none.
+
+    Returns 0 on success or the seconds until the first empty bucket has a
+    token again.
+    """
+    using = database()
+    with transaction.atomic(using=using):
+        for key, interval, burst in buckets:
+            wait = take_one(using, key, now, interval, burst)
+            if wait:
+                transaction.set_rollback(True, using=using)
+                return wait
+    return 0
+
+
+def take_one(using, key, now, interval, burst):
+    """GCRA: the bucket is the time ``tat`` at which it would be full again.
+
+    A request fits while ``tat`` is less than ``burst`` intervals ahead of
+    now, and moves ``tat`` one interval further.
+    """
+    buckets = ThrottleBucket.objects.using(using)
+    room = buckets.filter(key=key, tat__lte=now + (burst - 1) * interval)
+    if room.update(tat=Greatest(F('tat'), Value(now, output_field=FloatField())) + interval):
+        return 0
+    tat = buckets.filter(key=key).values_list('tat', flat=True).first()
+    if tat is None:
+        _, created = buckets.get_or_create(key=key, defaults={'tat': now + interval})
+        if created:
+            return 0
+        # Another worker created the bucket in the meantime.
+        return take_one(using, key, now, interval, burst)
+    return tat + interval - burst * interval - now
+
+
+def prune(now=None):
+    """Delete buckets that have refilled completely; returns how many."""
+    now = time.time() if now is None else now
+    deleted, _ = ThrottleBucket.objects.using(database()).filter(tat__lte=now).delete()
+    return deleted
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def __init__(self):
+        self.retry_after = None
+
+    def get_policies(self, view):
+        configured = getattr(settings, 'THROTTLE_POLICIES', {})
+        policies = []
+        for name in getattr(view, 'throttle_policies', ()):
+            if name not in configured:
+                raise ImproperlyConfigured(f'No THROTTLE_POLICIES entry for {name!r}.')
+            policies.append((name, configured[name]))
+        return sorted(policies, key=lambda policy: KEY_ORDER.index(policy[1].get('key', 'user')))
+
+    def allow_request(self, request, view):
+        if not getattr(settings, 'THROTTLE_ENABLED', True):
+            return True
+        buckets = [
+            (f'{name}:{KEY_FUNCTIONS[policy.get("key", "user")](self, request, view)}',
+             parse_rate(policy['rate']), policy.get('burst', 1))
+            for name, policy in self.get_policies(view)
+        ]
+        wait = take(buckets, time.time())
+        if wait:
+            self.retry_after = wait
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
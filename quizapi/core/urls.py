@@ -12,25 +12,36 @@ urlpatterns = [
     
     # Quiz endpoints (Admin only)
     path('quizzes/', views.QuizView.as_view(), name='quiz-list'),
+    path('quizzes/bulk/', views.BulkQuizView.as_view(), name='quiz-bulk'),
     path('quizzes/<int:pk>/', views.QuizDetailView.as_view(), name='quiz-detail'),
     path('quizzes/<int:pk>/toggle-active/', views.ToggleQuizActiveView.as_view(), name='toggle-quiz-active'),
+    path('quizzes/<int:pk>/regrade/', views.RegradeQuizView.as_view(), name='regrade-quiz'),
     
     # Question endpoints (Admin only)
     path('questions/', views.QuestionView.as_view(), name='question-list'),
+    path('questions/search/', views.QuestionSearchView.as_view(), name='question-search'),
+    path('questions/bulk/', views.BulkQuestionView.as_view(), name='question-bulk'),
     path('questions/<int:pk>/', views.QuestionDetailView.as_view(), name='question-detail'),
     path('questions/<int:pk>/toggle-active/', views.ToggleQuestionActiveView.as_view(), name='toggle-question-active'),
     
     # Option endpoints
     path('options/', views.OptionView.as_view(), name='option-list'),
+    path('options/bulk/', views.BulkOptionView.as_view(), name='option-bulk'),
     path('options/<int:pk>/', views.OptionDetailView.as_view(), name='option-detail'),
 
     # User endpoints
     path('quizzes/active/', views.ActiveQuizzesView.as_view(), name='active-quizzes'),
     path('quizzes/<int:quiz_id>/submit/', views.SubmitQuizView.as_view(), name='submit-quiz'),
+    path('quizzes/<int:quiz_id>/live/', views.QuizLiveFeedView.as_view(), name='quiz-live-feed'),
     path('submissions/history/', views.UserSubmissionHistoryView.as_view(), name='submission-history'),
     
     # Admin endpoints
     path('admin/submissions/', views.AllSubmissionsView.as_view(), name='all-submissions'),
+    path('admin/submissions/export/', views.SubmissionExportView.as_view(), name='submission-export'),
+    path('admin/purge-jobs/', views.PurgeJobListView.as_view(), name='purge-job-list'),
+    path('admin/purge-jobs/<int:pk>/', views.PurgeJobDetailView.as_view(), name='purge-job-detail'),
+    path('admin/analytics/quizzes/<int:pk>/', views.QuizAnalyticsView.as_view(), name='quiz-analytics'),
+    path('admin/analytics/categories/<int:pk>/', views.CategoryAnalyticsView.as_view(), name='category-analytics'),
 
     # Test Auth
     path('test-auth/', views.TestAuthView.as_view(), name='test-auth'),
@@ -1,18 +1,36 @@
-from rest_framework import status, permissions
+import asyncio
+import csv
+from datetime import datetime, time, timedelta
+
+from rest_framework import exceptions, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
+from django.db import transaction
 from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from .models import CustomUser, Category, Quiz, Question, QuizSubmission, Option
+from . import analytics, archive, bulk, counters, grading, history, purge
+from .broadcast import broadcaster, mark_changed
+from .search import get_backend
+from .throttling import TokenBucketThrottle
+from .models import CustomUser, Category, Quiz, Question, QuizSubmission, Option, QuizScoreRollup, PurgeJob
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserSerializer,
     CategorySerializer, QuizSerializer, QuestionSerializer,
     QuizSubmissionSerializer, QuizSubmissionHistorySerializer,
-    OptionSerializer
+    OptionSerializer, PurgeJobSerializer, QuizBulkActionSerializer,
+    QuestionBulkActionSerializer, OptionBulkActionSerializer
 )
 
 class IsAdmin(permissions.BasePermission):
@@ -25,6 +43,8 @@ class IsNormalUser(permissions.BasePermission):
 
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_policies = ('register',)
     
     def post(self, request):
         serializer = UserRegistrationSerializer(data=request.data)
@@ -40,6 +60,8 @@ class RegisterView(APIView):
 
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_policies = ('login', 'login_username')
     
     def post(self, request):
         serializer = UserLoginSerializer(data=request.data)
@@ -84,6 +106,7 @@ class CategoryDetailView(APIView):
         serializer = CategorySerializer(category, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            history.bump_global()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -92,19 +115,21 @@ class CategoryDetailView(APIView):
         serializer = CategorySerializer(category, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            history.bump_global()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def delete(self, request, pk):
         category = self.get_object(pk)
-        category.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        job = purge.soft_delete_category(category, request.user)
+        history.bump_global()
+        return Response(PurgeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 class QuizView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get(self, request):
-        quizzes = Quiz.objects.filter(is_active=True)
+        quizzes = Quiz.objects.filter(is_active=True).select_related('created_by').prefetch_related('questions')
         serializer = QuizSerializer(quizzes, many=True)
         return Response(serializer.data)
     
@@ -131,6 +156,7 @@ class QuizDetailView(APIView):
         serializer = QuizSerializer(quiz, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            history.bump_global()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -139,34 +165,78 @@ class QuizDetailView(APIView):
         serializer = QuizSerializer(quiz, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            history.bump_global()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     def delete(self, request, pk):
         quiz = self.get_object(pk)
-        quiz.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        job = purge.soft_delete_quiz(quiz, request.user)
+        history.bump_global()
+        return Response(PurgeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
 class QuestionView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get(self, request):
-        questions = Question.objects.filter(is_active=True)
+        questions = Question.objects.filter(is_active=True, quiz__deleted_at__isnull=True)
         serializer = QuestionSerializer(questions, many=True)
         return Response(serializer.data)
     
     def post(self, request):
         serializer = QuestionSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            question = serializer.save()
+            similar = get_backend().similar(question.text, exclude_ids={question.id})
+            return Response({
+                **serializer.data,
+                'similar_questions': search_results(similar, 'similarity'),
+            }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def search_results(ranked, score_field):
+    questions = Question.objects.in_bulk([question_id for question_id, _ in ranked])
+    results = []
+    for question_id, score in ranked:
+        if question_id in questions:
+            results.append({**QuestionSerializer(questions[question_id]).data, score_field: score})
+    return results
+
+class QuestionSearchView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def get(self, request):
+        params = request.query_params
+        query = params.get('q', '').strip()
+        if not query:
+            return Response({'q': 'This query parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            quiz_id = int(params['quiz']) if params.get('quiz') else None
+            category_id = int(params['category']) if params.get('category') else None
+            limit = min(max(int(params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return Response(
+                {'error': 'quiz, category and limit must be integers.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        is_active = None
+        if params.get('is_active') in ('true', 'false'):
+            is_active = params['is_active'] == 'true'
+        
+        backend = get_backend()
+        if params.get('similar') == 'true':
+            ranked = backend.similar(query, quiz_id=quiz_id, category_id=category_id, limit=limit)
+            return Response(search_results(ranked, 'similarity'))
+        ranked = backend.search(
+            query, quiz_id=quiz_id, category_id=category_id, is_active=is_active, limit=limit
+        )
+        return Response(search_results(ranked, 'score'))
+
 class QuestionDetailView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get_object(self, pk):
-        return get_object_or_404(Question, pk=pk)
+        return get_object_or_404(Question, pk=pk, quiz__deleted_at__isnull=True)
     
     def get(self, request, pk):
         question = self.get_object(pk)
@@ -183,14 +253,17 @@ class QuestionDetailView(APIView):
     
     def delete(self, request, pk):
         question = self.get_object(pk)
-        question.delete()
+        with transaction.atomic():
+            question.delete()
+            counters.question_removed(question)
+            mark_changed([question.quiz_id])
         return Response(status=status.HTTP_204_NO_CONTENT)
     
 class OptionView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get(self, request):
-        options = Option.objects.all()
+        options = Option.objects.filter(question__quiz__deleted_at__isnull=True)
         serializer = OptionSerializer(options, many=True)
         return Response(serializer.data)
     
@@ -205,7 +278,7 @@ class OptionDetailView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get_object(self, pk):
-        return get_object_or_404(Option, pk=pk)
+        return get_object_or_404(Option, pk=pk, question__quiz__deleted_at__isnull=True)
     
     def get(self, request, pk):
         option = self.get_object(pk)
@@ -238,21 +311,90 @@ class ToggleQuestionActiveView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def patch(self, request, pk):
-        question = get_object_or_404(Question, pk=pk)
+        question = get_object_or_404(Question, pk=pk, quiz__deleted_at__isnull=True)
         question.is_active = not question.is_active
-        question.save()
+        with transaction.atomic():
+            question.save()
+            counters.question_changed(question.quiz_id, not question.is_active, question)
         return Response({'is_active': question.is_active})
 
+class BulkQuizView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def post(self, request):
+        serializer = QuizBulkActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        action = data['action']
+        quizzes = bulk.select(Quiz.objects.all(), bulk.QUIZ_FILTERS, data.get('ids'), data.get('filter'))
+        if action == 'delete':
+            jobs = purge.soft_delete_quizzes(quizzes, request.user)
+            history.bump_global()
+            return Response({
+                'action': action,
+                'quizzes': len(jobs),
+                'purge_jobs': PurgeJobSerializer(jobs, many=True).data,
+            }, status=status.HTTP_202_ACCEPTED)
+        if action == 'recategorize':
+            counts = bulk.recategorize_quizzes(quizzes, data['category'])
+            history.bump_global()
+        else:
+            counts = bulk.set_quizzes_active(quizzes, action == 'activate')
+        return Response({'action': action, **counts})
+
+class BulkQuestionView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def post(self, request):
+        serializer = QuestionBulkActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        action = data['action']
+        questions = bulk.select(
+            Question.objects.filter(quiz__deleted_at__isnull=True),
+            bulk.QUESTION_FILTERS, data.get('ids'), data.get('filter')
+        )
+        if action == 'delete':
+            counts = bulk.delete_questions(questions)
+        elif action == 'move':
+            counts = bulk.move_questions(questions, data['quiz'])
+        else:
+            counts = bulk.set_questions_active(questions, action == 'activate')
+        return Response({'action': action, **counts})
+
+class BulkOptionView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def post(self, request):
+        serializer = OptionBulkActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        action = data['action']
+        options = bulk.select(
+            Option.objects.filter(question__quiz__deleted_at__isnull=True),
+            bulk.OPTION_FILTERS, data.get('ids'), data.get('filter')
+        )
+        if action == 'delete':
+            counts = bulk.delete_options(options)
+        else:
+            counts = bulk.set_options_correct(options, action == 'mark_correct')
+        return Response({'action': action, **counts})
+
 class ActiveQuizzesView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        quizzes = Quiz.objects.filter(is_active=True)
+        quizzes = Quiz.objects.filter(is_active=True).select_related('created_by').prefetch_related('questions')
         serializer = QuizSerializer(quizzes, many=True)
         return Response(serializer.data)
 
 class SubmitQuizView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_policies = ('submit', 'submit_quiz', 'quiz_submissions')
     
     def post(self, request, quiz_id):
         quiz = get_object_or_404(Quiz, pk=quiz_id, is_active=True)
@@ -262,7 +404,7 @@ class SubmitQuizView(APIView):
             user=request.user, quiz=quiz
         ).first()
         
-        if existing_submission:
+        if existing_submission or archive.has_submission(request.user.id, quiz.id):
             return Response(
                 {'error': 'You have already submitted this quiz.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -275,6 +417,8 @@ class SubmitQuizView(APIView):
         serializer = QuizSubmissionSerializer(data=data)
         if serializer.is_valid():
             submission = serializer.save(user=request.user, quiz=quiz)
+            history.bump_user(request.user.id)
+            broadcaster.notify()
             return Response(QuizSubmissionHistorySerializer(submission).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -282,18 +426,192 @@ class UserSubmissionHistoryView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        submissions = QuizSubmission.objects.filter(user=request.user)
-        serializer = QuizSubmissionHistorySerializer(submissions, many=True)
-        return Response(serializer.data)
+        return HttpResponse(history.get_history(request.user), content_type='application/json')
 
 class AllSubmissionsView(APIView):
     permission_classes = [IsAuthenticated, IsAdmin]
     
     def get(self, request):
-        submissions = QuizSubmission.objects.all()
+        submissions = QuizSubmission.objects.filter(quiz__deleted_at__isnull=True).select_related(
+            'quiz__created_by'
+        ).prefetch_related('quiz__questions')
         serializer = QuizSubmissionHistorySerializer(submissions, many=True)
         return Response(serializer.data)
 
+class Echo:
+    """File-like object whose write() hands the value back, for streaming csv."""
+    def write(self, value):
+        return value
+
+class SubmissionExportView(APIView):
+    """Stream every submission as CSV, including archived ones.
+    
+    Archived segments are read one compressed block at a time and hot rows
+    through a chunked iterator, so memory stays flat regardless of size.
+    """
+    permission_classes = [IsAuthenticated, IsAdmin]
+    header = ('id', 'user', 'quiz', 'score', 'total_questions', 'submitted_at', 'archived')
+    
+    def get(self, request):
+        params = request.query_params
+        filters = {}
+        for name in ('since', 'until'):
+            if params.get(name):
+                day = parse_date(params[name])
+                if day is None:
+                    return Response(
+                        {name: 'Expected a date in YYYY-MM-DD format.'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                start = timezone.make_aware(datetime.combine(day, time.min))
+                # ``until`` is inclusive of the whole day.
+                filters[name] = start + timedelta(days=1) if name == 'until' else start
+        quiz_id = None
+        if params.get('quiz'):
+            if not params['quiz'].isdigit():
+                return Response({'quiz': 'Expected a quiz id.'}, status=status.HTTP_400_BAD_REQUEST)
+            quiz_id = int(params['quiz'])
+        
+        writer = csv.writer(Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in self.rows(quiz_id, **filters)),
+            content_type='text/csv'
+        )
+        response['Content-Disposition'] = 'attachment; filename="submissions.csv"'
+        return response
+    
+    def rows(self, quiz_id, since=None, until=None):
+        yield self.header
+        live_quizzes = set(Quiz.objects.values_list('pk', flat=True))
+        for row in archive.iter_archived(quiz_id=quiz_id, since=since, until=until):
+            if row.quiz_id in live_quizzes:
+                yield (row.id, row.user_id, row.quiz_id, row.score, row.total_questions,
+                       row.submitted_at.isoformat(), 1)
+        
+        submissions = QuizSubmission.objects.filter(quiz__deleted_at__isnull=True).order_by('pk')
+        if quiz_id is not None:
+            submissions = submissions.filter(quiz_id=quiz_id)
+        if since is not None:
+            submissions = submissions.filter(submitted_at__gte=since)
+        if until is not None:
+            submissions = submissions.filter(submitted_at__lt=until)
+        for row in submissions.values_list(
+            'pk', 'user_id', 'quiz_id', 'score', 'total_questions', 'submitted_at'
+        ).iterator(chunk_size=2000):
+            yield (*row[:5], row[5].isoformat(), 0)
+
+class RegradeQuizView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def post(self, request, pk):
+        quiz = get_object_or_404(Quiz, pk=pk)
+        return Response({'regraded': grading.regrade_quiz(quiz)})
+
+class ScoreAnalyticsMixin:
+    def filter_days(self, request, rollups):
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        for name, value, lookup in (('start', start, 'day__gte'), ('end', end, 'day__lte')):
+            if value is None:
+                continue
+            day = parse_date(value)
+            if day is None:
+                return None, Response(
+                    {name: 'Expected a date in YYYY-MM-DD format.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            rollups = rollups.filter(**{lookup: day})
+        return rollups, None
+
+class QuizAnalyticsView(ScoreAnalyticsMixin, APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def get(self, request, pk):
+        quiz = get_object_or_404(Quiz, pk=pk)
+        rollups, error = self.filter_days(request, QuizScoreRollup.objects.filter(quiz=quiz))
+        if error:
+            return error
+        return Response({'quiz': quiz.id, **analytics.summarize(rollups)})
+
+class CategoryAnalyticsView(ScoreAnalyticsMixin, APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def get(self, request, pk):
+        category = get_object_or_404(Category, pk=pk)
+        rollups, error = self.filter_days(request, QuizScoreRollup.objects.filter(
+            quiz__category=category, quiz__deleted_at__isnull=True
+        ))
+        if error:
+            return error
+        return Response({'category': category.id, **analytics.summarize(rollups)})
+
+class PurgeJobListView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def get(self, request):
+        jobs = PurgeJob.objects.order_by('-created_at')
+        if request.query_params.get('status'):
+            jobs = jobs.filter(status=request.query_params['status'])
+        serializer = PurgeJobSerializer(jobs, many=True)
+        return Response(serializer.data)
+
+class PurgeJobDetailView(APIView):
+    permission_classes = [IsAuthenticated, IsAdmin]
+    
+    def get(self, request, pk):
+        job = get_object_or_404(PurgeJob, pk=pk)
+        return Response(PurgeJobSerializer(job).data)
+
+class QuizLiveFeedView(View):
+    """Server-sent events with new submissions and leaderboard changes.
+
+    EventSource cannot send headers, so the JWT access token may also be
+    passed as ``?token=``.  Only ASGI workers serve it: WSGI collects a
+    streaming response before sending it, and this stream never ends.
+    """
+    heartbeat_seconds = 15
+    
+    async def get(self, request, quiz_id):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'detail': 'The live feed is only served by ASGI workers.'}, status=501)
+        user = await sync_to_async(self.authenticate)(request)
+        if user is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+        exists = await Quiz.objects.filter(pk=quiz_id, is_active=True).aexists()
+        if not exists:
+            return JsonResponse({'detail': 'No Quiz matches the given query.'}, status=404)
+        
+        response = StreamingHttpResponse(self.stream(quiz_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def authenticate(self, request):
+        auth = JWTAuthentication()
+        try:
+            result = auth.authenticate(request)
+            if result is None and request.GET.get('token'):
+                token = auth.get_validated_token(request.GET['token'])
+                return auth.get_user(token)
+        except (InvalidToken, TokenError, exceptions.AuthenticationFailed):
+            return None
+        return result[0] if result else None
+    
+    async def stream(self, quiz_id):
+        subscriber = await broadcaster.subscribe(quiz_id)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield b': keep-alive\n\n'
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
 class TestAuthView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -133,6 +133,11 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Reverse proxies in front of the app. Client addresses (used by the
+    # per-IP throttles) come from REMOTE_ADDR when 0, otherwise from that
+    # many trusted hops of X-Forwarded-For; left unset, DRF would trust a
+    # client-supplied X-Forwarded-For header.
+    'NUM_PROXIES': 0,
 }
 
 from datetime import timedelta
@@ -140,3 +145,75 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
+
+# Minimum score percentage counted as a pass in the score analytics rollups.
+QUIZ_PASS_PERCENTAGE = 60
+
+# Quiz and category deletes are soft deletes followed by a chunked purge.
+# Set PURGE_IN_BACKGROUND_THREAD = False to leave purging to
+# `manage.py run_purge_jobs` instead of an in-process thread.
+PURGE_CHUNK_SIZE = 1000
+PURGE_IN_BACKGROUND_THREAD = True
+
+# Question bank full-text search. Use 'core.search.SimpleSearchBackend' on
+# databases without SQLite FTS5.
+QUESTION_SEARCH_BACKEND = 'core.search.SQLiteFTS5Backend'
+
+# Caches. 'default' and 'history' are per process; anything whose
+# invalidation has to reach every worker lives in 'shared', a database table
+# created by `manage.py createcachetable`. Redis or Memcached work there too.
+# Keep large, numerous values out of 'shared': every write to a database
+# cache counts its rows.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered history payloads. Each one is tagged with the shared versions
+    # it was built from, so a worker's copy is only served while current.
+    'history': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'history',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'core_shared_cache',
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+}
+
+HISTORY_CACHE_ALIAS = 'history'
+# History versions are bumped by whichever worker handled the write, so
+# every worker must read them from the same place.
+HISTORY_VERSION_CACHE_ALIAS = 'shared'
+HISTORY_CACHE_TIMEOUT = 60 * 60
+
+# Seconds between live-feed polls; each worker polls once per tick for all
+# of its subscribers, and the submit path wakes the poller early.
+LIVE_FEED_POLL_INTERVAL = 1.0
+# Leaderboard versions bumped by regrades and deletes; shared like the
+# history versions so every worker sees them.
+LIVE_FEED_CACHE_ALIAS = 'shared'
+
+# Cold storage for old submissions (`manage.py archive_submissions`). Whole
+# months older than ARCHIVE_AFTER_DAYS move to compressed segment files.
+ARCHIVE_ROOT = BASE_DIR / 'archive'
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_BLOCK_ROWS = 1000
+# Per-process budget for parsed segment indexes (decompressed JSON bytes).
+ARCHIVE_INDEX_CACHE_BYTES = 16 * 1024 * 1024
+
+# Token-bucket throttles (core.throttling). `rate` is the refill rate,
+# `burst` the bucket size, `key` one of ip, user, username, quiz, user_quiz.
+# Buckets are rows in the THROTTLE_DATABASE database, which every worker
+# process shares. Client IPs follow REST_FRAMEWORK['NUM_PROXIES'].
+THROTTLE_ENABLED = True
+THROTTLE_DATABASE = 'default'
+THROTTLE_POLICIES = {
+    'register': {'rate': '10/h', 'burst': 5, 'key': 'ip'},
+    'login': {'rate': '30/min', 'burst': 10, 'key': 'ip'},
+    'login_username': {'rate': '10/min', 'burst': 5, 'key': 'username'},
+    'submit': {'rate': '30/min', 'burst': 10, 'key': 'user'},
+    'submit_quiz': {'rate': '6/min', 'burst': 3, 'key': 'user_quiz'},
+    'quiz_submissions': {'rate': '50/s', 'burst': 200, 'key': 'quiz'},
+}
@@ -0,0 +1,40 @@
+"""
+Lean settings profile for API-only workers.
+
+Serves only ``core.urls`` (under ``/api/``) with JWT authentication, so
+the admin, sessions, messages, staticfiles and template machinery are not
+loaded and requests skip the session, CSRF, auth and message middleware.
+The admin site keeps running on the full ``quizapi.settings`` profile.
+
+Entry points: ``quizapi.wsgi_api`` and ``quizapi.asgi_api``.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import REST_FRAMEWORK
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+    'rest_framework_simplejwt',
+    'core',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'quizapi.urls_api'
+
+WSGI_APPLICATION = 'quizapi.wsgi_api.application'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    # The browsable API needs templates and static files; JSON only here.
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+    ),
+}
@@ -0,0 +1,10 @@
+"""
+URL configuration for the API-only worker profile (``quizapi.settings_api``).
+
+Same ``/api/`` routes as ``quizapi.urls``, without the admin site.
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('core.urls')),
+]
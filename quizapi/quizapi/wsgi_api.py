@@ -0,0 +1,14 @@
+"""
+WSGI config for the API-only worker profile.
+
+Always uses ``quizapi.settings_api``, even if DJANGO_SETTINGS_MODULE points
+at the full profile, so an API worker can never load the admin stack.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'quizapi.settings_api'
+
+application = get_wsgi_application()